@@ -0,0 +1,262 @@
+"""
+自适应并发控制（AIMD）
+批量评测脚本共用：延迟平稳时逐步提高并发上限（加性增），出现 429/5xx/超时等过载错误或延迟明显升高时
+按比例降低上限（乘性减），让并发数贴合 vLLM 服务端当前的承载能力。
+运行中定期打印吞吐与延迟，结束时调用 print_summary 输出汇总。
+
+过载错误需要原样到达限制器：评测脚本的客户端以 max_retries=ADAPTIVE_CLIENT_MAX_RETRIES（默认 0）创建，
+不在 SDK 内部重试；由 AdaptiveLimiter.run 在降低并发后重新排队执行，重试次数用尽才视为失败。
+
+环境变量：
+- ADAPTIVE_MAX_CONCURRENCY：并发上限的最大值（默认 128）
+- ADAPTIVE_LATENCY_TOLERANCE：近期平均延迟超过基线的倍数视为延迟升高（默认 3.0）
+- ADAPTIVE_REPORT_INTERVAL：运行中打印统计的间隔，秒（默认 10，<=0 关闭）
+- ADAPTIVE_MAX_ATTEMPTS：单个请求遇到过载错误时最多执行的次数（默认 5）
+- ADAPTIVE_RETRY_BACKOFF：过载重试前的基础等待秒数，按次数指数增长（默认 1.0）
+- ADAPTIVE_CLIENT_MAX_RETRIES：评测脚本客户端的 SDK 内部重试次数（默认 0）
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+import openai
+
+
+ADAPTIVE_MAX_CONCURRENCY = int(os.getenv("ADAPTIVE_MAX_CONCURRENCY", "128"))
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE", "3.0"))
+ADAPTIVE_REPORT_INTERVAL = float(os.getenv("ADAPTIVE_REPORT_INTERVAL", "10"))
+ADAPTIVE_MAX_ATTEMPTS = int(os.getenv("ADAPTIVE_MAX_ATTEMPTS", "5"))
+ADAPTIVE_RETRY_BACKOFF = float(os.getenv("ADAPTIVE_RETRY_BACKOFF", "1.0"))
+ADAPTIVE_CLIENT_MAX_RETRIES = int(os.getenv("ADAPTIVE_CLIENT_MAX_RETRIES", "0"))
+# 单次重试等待的上限（秒）
+MAX_RETRY_BACKOFF = 30.0
+
+# 视为服务端过载的 HTTP 状态码
+OVERLOAD_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """限流、服务端错误、超时与连接失败视为过载信号；调用方包装过的异常沿异常链向上查找"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+            return True
+        if getattr(exc, "status_code", None) in OVERLOAD_STATUS_CODES:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def _ewma(previous: Optional[float], value: float, alpha: float) -> float:
+    return value if previous is None else alpha * value + (1 - alpha) * previous
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(math.ceil(q * len(sorted_values))) - 1)]
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器，用法：async with limiter.slot(): await call()"""
+
+    # 近期延迟的 EWMA 系数
+    LATENCY_ALPHA = 0.2
+    # 基线延迟取近期延迟的最小值，每个样本允许回升的比例，服务端整体变慢后基线可以逐步跟上
+    BASELINE_DRIFT = 0.0005
+    # 样本数达到该值后才按延迟调整，避免冷启动时的抖动
+    WARMUP_SAMPLES = 10
+
+    def __init__(self, initial: int = 16, min_limit: int = 1, max_limit: int = ADAPTIVE_MAX_CONCURRENCY,
+                 latency_tolerance: float = ADAPTIVE_LATENCY_TOLERANCE, error_backoff: float = 0.5,
+                 latency_backoff: float = 0.8, adaptive: bool = True,
+                 report_interval: float = ADAPTIVE_REPORT_INTERVAL, name: str = "评测"):
+        """
+        Args:
+            initial: 初始并发上限
+            min_limit / max_limit: 并发上限的范围
+            latency_tolerance: 近期延迟超过基线的倍数时降低并发
+            error_backoff: 过载错误时上限乘以该系数
+            latency_backoff: 延迟升高时上限乘以该系数
+            adaptive: False 时固定为 initial，相当于信号量，仍然统计吞吐与延迟
+            report_interval: 运行中打印统计的间隔（秒），<=0 不打印
+        """
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, initial) if adaptive else initial
+        self.limit = float(max(min_limit, min(initial, self.max_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.error_backoff = error_backoff
+        self.latency_backoff = latency_backoff
+        self.report_interval = report_interval
+        self.name = name
+
+        self._inflight = 0
+        self._condition = asyncio.Condition()
+        self._baseline = None
+        self._smoothed = None
+        self._last_decrease = 0.0
+
+        self.started_at = time.perf_counter()
+        self._last_report = self.started_at
+        self.completed = 0
+        self.errors = 0
+        self.overloads = 0
+        self.retries = 0
+        self.failures = 0
+        self.decreases = 0
+        self.latencies: list[float] = []
+        self.peak_limit = self.limit
+        self.lowest_limit = self.limit
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个并发名额，执行结束后按耗时与是否出错调整并发上限"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._inflight < int(self.limit))
+            self._inflight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                self._on_error(e)
+            raise
+        else:
+            self._on_success(time.perf_counter() - start)
+        finally:
+            async with self._condition:
+                self._inflight -= 1
+                self._condition.notify_all()
+
+    async def run(self, func: Callable[[], Awaitable], max_attempts: int = ADAPTIVE_MAX_ATTEMPTS,
+                  retry_backoff: float = ADAPTIVE_RETRY_BACKOFF):
+        """
+        在并发名额内执行 func()，过载错误时等待后重新排队执行（此时并发上限已下调）
+
+        非过载错误直接抛出；过载错误在 max_attempts 次后仍失败时抛出最后一次的异常。
+        """
+        for attempt in range(1, max_attempts + 1):
+            try:
+                async with self.slot():
+                    return await func()
+            except Exception as e:
+                if not is_overload_error(e) or attempt >= max_attempts:
+                    self.failures += 1
+                    raise
+            self.retries += 1
+            # 等待期间不占用并发名额
+            await asyncio.sleep(min(MAX_RETRY_BACKOFF, retry_backoff * 2 ** (attempt - 1)))
+
+    def _on_success(self, latency: float):
+        self.completed += 1
+        self.latencies.append(latency)
+        self._smoothed = _ewma(self._smoothed, latency, self.LATENCY_ALPHA)
+        self._baseline = self._smoothed if self._baseline is None else (
+            min(self._smoothed, self._baseline * (1 + self.BASELINE_DRIFT))
+        )
+        if self.completed >= self.WARMUP_SAMPLES and self._smoothed > self._baseline * self.latency_tolerance:
+            self._decrease(self.latency_backoff)
+        elif self.adaptive:
+            # 加性增：每完成约 limit 个请求（一轮）上限加 1
+            self._set_limit(self.limit + 1 / self.limit)
+        self._maybe_report()
+
+    def _on_error(self, exc: BaseException):
+        self.errors += 1
+        if is_overload_error(exc):
+            self.overloads += 1
+            self._decrease(self.error_backoff)
+
+    def _decrease(self, factor: float):
+        if not self.adaptive:
+            return
+        # 同一轮在途请求会同时感知到过载，一个平滑延迟周期内只降一次
+        now = time.perf_counter()
+        if now - self._last_decrease < (self._smoothed or 0.0):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self._set_limit(self.limit * factor)
+
+    def _set_limit(self, limit: float):
+        self.limit = max(float(self.min_limit), min(float(self.max_limit), limit))
+        self.peak_limit = max(self.peak_limit, self.limit)
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+
+    def _maybe_report(self):
+        if self.report_interval <= 0:
+            return
+        now = time.perf_counter()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            print(f"[{self.name}] {self.summary()}")
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        latencies = sorted(self.latencies)
+        return {
+            "completed": self.completed,
+            "errors": self.errors,
+            "overloads": self.overloads,
+            "retries": self.retries,
+            "failures": self.failures,
+            "elapsed": elapsed,
+            "throughput": self.completed / elapsed if elapsed > 0 else 0.0,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p50": _percentile(latencies, 0.5),
+            "latency_p95": _percentile(latencies, 0.95),
+            "limit": int(self.limit),
+            "peak_limit": int(self.peak_limit),
+            "lowest_limit": int(self.lowest_limit),
+            "decreases": self.decreases,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (f"完成 {s['completed']}，出错 {s['errors']}（过载 {s['overloads']}，重试 {s['retries']}，"
+                f"最终失败 {s['failures']}），耗时 {s['elapsed']:.1f}s，"
+                f"吞吐 {s['throughput']:.2f} 条/s，延迟 平均 {s['latency_avg']:.2f}s / P50 {s['latency_p50']:.2f}s / "
+                f"P95 {s['latency_p95']:.2f}s，并发上限 当前 {s['limit']}（{s['lowest_limit']}~{s['peak_limit']}，"
+                f"下调 {s['decreases']} 次）")
+
+    def print_summary(self):
+        print(f"\n===== 吞吐与延迟（{self.name}） =====\n{self.summary()}")
+
+
+async def ordered_map(func: Callable[..., Awaitable], items: Iterable, limiter: AdaptiveLimiter,
+                      max_pending: Optional[int] = None, return_exceptions: bool = False) -> AsyncIterator:
+    """
+    在 limiter 控制下并发执行 func(item)，按 items 的顺序产出结果
+
+    在途任务数不超过 max_pending（默认为 limiter 上限的 2 倍），避免一次性为全部输入创建任务。
+    过载错误由 limiter.run 降低并发后重试；最终失败时异常在产出对应位置的结果时抛出，
+    return_exceptions=True 时与 asyncio.gather 一致，异常对象作为该位置的结果产出。
+    """
+    max_pending = max_pending or limiter.max_limit * 2
+
+    async def run(item):
+        try:
+            return await limiter.run(lambda: func(item))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return e
+
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(asyncio.ensure_future(run(item)))
+            if len(pending) >= max_pending:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -3,29 +3,98 @@ FastAPI 接口服务
 提供查询改写功能
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional
 import uvicorn
 
-from openai import OpenAI
 from fastapi.middleware.cors import CORSMiddleware
 
-from prompt_templates import SYSTEM_PROMPT, build_user_prompt
-from risk_detect.api import RiskResponse, QueryRequest, judge, send_wechat_group_notification
+from intent_recognization.control import SUB_QUESTIONS_MODEL, SubQuestionsResult, adecompose_sub_questions
+from intent_recognization.prompt_template import SUB_QUESTIONS_SYSTEM_CONTENT
+from llm_client import get_async_client, close_async_clients
+from micro_batcher import create_micro_batcher
+from prompt_templates import build_budgeted_messages
+from rewrite_cache import RewriteCache
+from rewrite_precheck import aneeds_rewrite
+from singleflight import SingleFlight
+from risk_detect.api import RiskResponse, QueryRequest, judge, notification_dispatcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动通知分发任务，退出时提交剩余微批请求、发送剩余通知并关闭连接池与缓存"""
+    notification_dispatcher.start()
+    yield
+    for batcher in (rewrite_batcher, judge.emotion_analyzer.batcher):
+        if batcher is not None:
+            await batcher.drain()
+    await notification_dispatcher.stop()
+    await close_async_clients()
+    rewrite_cache.close()
+    sub_questions_cache.close()
+
 
 # 初始化 FastAPI 应用
 app = FastAPI(
     title="查询改写 API",
     description="提供基于 Qwen 模型的对话查询改写服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 # 配置本地模型
 BASE_URL = "https://vllm-qwen3.vertu.cn/v1"
 MODEL_NAME = "vemory_1_2w_pt"
-client = OpenAI(api_key="EMPTY", base_url=BASE_URL)
+client = get_async_client(BASE_URL)
+REWRITE_TEMPERATURE = 0.3
+# 改写输出的 token 上限。微批走 /v1/completions，vLLM 在未指定 max_tokens 时只生成 16 个 token，必须显式传入
+REWRITE_MAX_TOKENS = int(os.getenv("REWRITE_MAX_TOKENS", "256"))
+
+# 微批调度（MICRO_BATCH_ENABLED=1 开启）：缓存未命中的改写请求攒批后通过 completions 接口一次提交
+rewrite_batcher = create_micro_batcher(
+    client, MODEL_NAME, temperature=REWRITE_TEMPERATURE, max_tokens=REWRITE_MAX_TOKENS
+)
+
+# 批量改写默认并发上限，可通过请求参数 max_concurrency 覆盖
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# 改写结果缓存：REWRITE_CACHE_SIZE=0 关闭，REWRITE_CACHE_DB 配置后启用 SQLite 磁盘层
+rewrite_cache = RewriteCache(
+    max_size=int(os.getenv("REWRITE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("REWRITE_CACHE_TTL", "3600")),
+    db_path=os.getenv("REWRITE_CACHE_DB") or None,
+)
+
+# 请求 token 预算：整个 prompt（含静态前缀与当前查询）的上限，以及单轮历史回答的上限。
+# window_size 仍是历史轮数上限，超出 token 预算的更早轮次会被丢弃
+REWRITE_MAX_PROMPT_TOKENS = int(os.getenv("REWRITE_MAX_PROMPT_TOKENS", "2048"))
+REWRITE_MAX_ANSWER_TOKENS = int(os.getenv("REWRITE_MAX_ANSWER_TOKENS", "256"))
+
+# 缓存未命中时合并相同的在途请求：同一 prompt 同时只调用一次模型
+rewrite_flight = SingleFlight()
+
+# 子问题拆解结果缓存（按查询缓存），配置方式同改写缓存
+sub_questions_cache = RewriteCache(
+    max_size=int(os.getenv("SUB_QUESTIONS_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SUB_QUESTIONS_CACHE_TTL", "3600")),
+    db_path=os.getenv("SUB_QUESTIONS_CACHE_DB") or None,
+)
+sub_questions_flight = SingleFlight()
+
+# 本地前置判断开关：无需改写的查询直接返回原文，不调用模型。
+# 启发式判断存在少量误跳过（正样本约 1%），默认关闭，按部署需要开启
+REWRITE_PRECHECK_ENABLED = os.getenv("REWRITE_PRECHECK", "0") == "1"
+
+# 改写路径统计：skip（前置判断跳过）/ cache（命中缓存）/ llm（调用模型）
+rewrite_path_counts = {"skip": 0, "cache": 0, "llm": 0}
 
 
 # ========== 数据模型定义 ==========
@@ -37,7 +106,7 @@ class ParamPair(BaseModel):
 
 class ContextInfo(BaseModel):
     """上下文信息"""
-    window_size: int = Field(1, description="对话窗口大小")
+    window_size: int = Field(1, description="对话窗口大小（最多带入的历史轮数，实际轮数还受 token 预算限制）")
     timestamp: Optional[str] = Field(None, description="时间戳")
 
 
@@ -71,6 +140,169 @@ class QueryRewriteResponse(BaseModel):
     rewritten_query: str = Field(..., description="改写后的查询")
     success: bool = Field(True, description="是否成功")
     timestamp: Optional[str] = Field(None, description="处理时间戳")
+    rewrite_path: str = Field(
+        "llm", description="改写路径：skip（无需改写，直接返回原查询）/ cache（命中缓存）/ llm（调用模型）"
+    )
+    prompt_tokens: int = Field(0, description="请求模型（或命中缓存）的 prompt token 数，skip 时为 0")
+
+
+class SubQuestionsRequest(BaseModel):
+    """子问题拆解请求"""
+    query: str = Field(..., description="用户查询")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "query": "LIFE 与 AGENT Q价格差异"
+            }
+        }
+
+
+class SubQuestionsResponse(BaseModel):
+    """子问题拆解响应"""
+    query: str = Field(..., description="原始查询")
+    is_complex: bool = Field(..., description="是否为复杂问题（由模型判定）")
+    sub_questions: list[str] = Field(..., description="子问题列表，简单问题为 [原始查询]")
+    cached: bool = Field(False, description="是否命中缓存")
+    complete: bool = Field(True, description="模型输出是否完整；被截断时只返回完整的子问题，且结果不写入缓存")
+    success: bool = Field(True, description="是否成功")
+
+
+# ========== 模型调用 ==========
+
+async def _prepare_rewrite(history_qas: list, question: str):
+    """
+    调用模型前的准备：按 token 预算截断过长回答、选取历史，再依次尝试本地前置判断与缓存
+
+    Returns:
+        (消息列表, 缓存键, prompt token 数, 已得到的结果)；
+        已得到的结果为 (改写后的查询, 改写路径) 时无需调用模型，否则为 None
+    """
+    messages, history_qas, prompt_tokens = build_budgeted_messages(
+        history_qas, question, REWRITE_MAX_PROMPT_TOKENS, REWRITE_MAX_ANSWER_TOKENS
+    )
+    if REWRITE_PRECHECK_ENABLED and not await aneeds_rewrite(history_qas, question):
+        rewrite_path_counts["skip"] += 1
+        return messages, None, 0, (question, "skip")
+
+    cache_key = RewriteCache.make_key(*(m["content"] for m in messages), MODEL_NAME, REWRITE_TEMPERATURE)
+    cached = await rewrite_cache.aget(cache_key)
+    if cached is not None:
+        rewrite_path_counts["cache"] += 1
+        return messages, cache_key, prompt_tokens, (cached, "cache")
+    return messages, cache_key, prompt_tokens, None
+
+
+async def call_rewrite_model(history_qas: list, question: str) -> tuple[str, str, int]:
+    """
+    根据历史对话与当前查询得到改写后的查询
+
+    先按 token 预算截断过长回答、选取历史，再依次尝试本地前置判断、缓存，最后才调用模型。
+
+    Returns:
+        (改写后的查询, 改写路径, prompt token 数)
+    """
+    messages, cache_key, prompt_tokens, resolved = await _prepare_rewrite(history_qas, question)
+    if resolved is not None:
+        return resolved[0], resolved[1], prompt_tokens
+
+    # 相同 prompt 已有请求在途时等待其结果，不重复调用模型
+    rewritten_query, _ = await rewrite_flight.do(cache_key, lambda: _complete_rewrite(messages, cache_key))
+    return rewritten_query, "llm", prompt_tokens
+
+
+async def _complete_rewrite(messages: list[dict], cache_key: str) -> str:
+    """调用模型改写并写入缓存（输出被 max_tokens 截断时不缓存）"""
+    if rewrite_batcher is not None:
+        text, finish_reason = await rewrite_batcher.submit_choice(messages)
+        rewritten_query = text.strip()
+    else:
+        completion = await client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            temperature=REWRITE_TEMPERATURE,
+            max_tokens=REWRITE_MAX_TOKENS,
+        )
+        rewritten_query = completion.choices[0].message.content.strip()
+        finish_reason = completion.choices[0].finish_reason
+    if finish_reason != "length":
+        rewrite_cache.set(cache_key, rewritten_query)
+    rewrite_path_counts["llm"] += 1
+    return rewritten_query
+
+
+async def stream_rewrite_model(history_qas: list, question: str):
+    """
+    call_rewrite_model 的流式版本（异步生成器）
+
+    调用模型时以 stream=True 请求，依次产出 ("delta", 新增文本)；最后产出
+    ("done", (改写后的查询, 改写路径, prompt token 数))。无需改写或命中缓存时只产出 done。
+    """
+    messages, cache_key, prompt_tokens, resolved = await _prepare_rewrite(history_qas, question)
+    if resolved is not None:
+        yield "done", (resolved[0], resolved[1], prompt_tokens)
+        return
+
+    stream = await client.chat.completions.create(
+        model=MODEL_NAME,
+        messages=messages,
+        temperature=REWRITE_TEMPERATURE,
+        max_tokens=REWRITE_MAX_TOKENS,
+        stream=True,
+    )
+    parts = []
+    finish_reason = None
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield "delta", delta
+    finally:
+        # 客户端提前断开时关闭上游连接，停止生成
+        await stream.close()
+
+    rewritten_query = "".join(parts).strip()
+    if finish_reason != "length":
+        rewrite_cache.set(cache_key, rewritten_query)
+    rewrite_path_counts["llm"] += 1
+    yield "done", (rewritten_query, "llm", prompt_tokens)
+
+
+async def call_sub_questions(query: str) -> tuple[SubQuestionsResult, bool]:
+    """
+    拆解查询为子问题，先查缓存，相同查询同时在途时只调用一次模型
+
+    Returns:
+        (拆解结果, 是否命中缓存)；只有完整解析且非空的结果才写入缓存，
+        模型输出无法解析时子问题列表为空，被截断时只包含完整的子问题
+    """
+    cache_key = RewriteCache.make_key(SUB_QUESTIONS_SYSTEM_CONTENT, query, SUB_QUESTIONS_MODEL)
+    cached = await sub_questions_cache.aget(cache_key)
+    if cached is not None:
+        entry = json.loads(cached)
+        if isinstance(entry, list):
+            # 旧格式的缓存条目只有子问题列表
+            return SubQuestionsResult(entry, len(entry) > 1, True), True
+        return SubQuestionsResult(entry["sub_questions"], entry["is_complex"], True), True
+
+    async def decompose() -> SubQuestionsResult:
+        result = await adecompose_sub_questions(query, SUB_QUESTIONS_SYSTEM_CONTENT)
+        if result.tasks and result.complete:
+            sub_questions_cache.set(cache_key, json.dumps(
+                {"sub_questions": result.tasks, "is_complex": result.is_complex}, ensure_ascii=False
+            ))
+        return result
+
+    result, _ = await sub_questions_flight.do(cache_key, decompose)
+    return result, False
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 # ========== API 接口 ==========
@@ -83,7 +315,10 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "查询改写": "/api/rewrite",
+            "流式改写": "/api/rewrite/stream",
             "批量改写": "/api/batch-rewrite",
+            "子问题拆解": "/api/sub-questions",
+            "批量子问题拆解": "/api/batch-sub-questions",
             "健康检查": "/health"
         }
     }
@@ -92,7 +327,33 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康检查接口"""
-    return {"status": "healthy", "model": MODEL_NAME}
+    return {
+        "status": "healthy",
+        "model": MODEL_NAME,
+        "rewrite_cache": rewrite_cache.stats(),
+        "rewrite_paths": dict(rewrite_path_counts),
+        "rewrite_singleflight": rewrite_flight.stats(),
+        "sub_questions_cache": sub_questions_cache.stats(),
+        "sub_questions_singleflight": sub_questions_flight.stats(),
+        "micro_batch": {
+            "rewrite": rewrite_batcher.stats() if rewrite_batcher else None,
+            "emotion": judge.emotion_analyzer.batcher.stats() if judge.emotion_analyzer.batcher else None,
+        },
+        "notifications": notification_dispatcher.stats(),
+    }
+
+
+def _request_history(request: QueryRewriteRequest) -> tuple[list, str]:
+    """从改写请求中取出最近 window_size 轮历史对话与当前查询"""
+    # param_pairs 可以为空，表示没有历史对话
+
+    # 获取窗口大小，默认为1
+    window_size = 1
+    if request.context and request.context.window_size:
+        window_size = request.context.window_size
+
+    # 当前查询从 request.query 获取，param_pairs 全部是历史对话
+    return request.param_pairs[-window_size:], request.query
 
 
 @app.post("/api/rewrite", response_model=QueryRewriteResponse)
@@ -103,46 +364,17 @@ async def rewrite_query(request: QueryRewriteRequest):
     根据对话历史，将用户的当前查询改写为独立、完整的搜索查询
     """
     try:
-        # param_pairs 可以为空，表示没有历史对话
-        
-        # 获取窗口大小，默认为1
-        window_size = 1
-        if request.context and request.context.window_size:
-            window_size = request.context.window_size
-        
-        # 根据窗口大小获取历史对话
-        recent_pairs = request.param_pairs
-        
-        # 当前查询从 request.query 获取
-        current_question = request.query
-
-        # 获取历史对话（param_pairs 全部是历史对话）
-        if len(recent_pairs) >= 1:
-            # 取最近 window_size 轮历史
-            history_qas = recent_pairs[-window_size:]
-        else:
-            # 没有历史
-            history_qas = []
-        # 构建提示词
-        prompt = build_user_prompt(history_qas, current_question)
-        
-        # 调用模型
-        completion = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-        )
-        
-        rewritten_query = completion.choices[0].message.content.strip()
+        history_qas, current_question = _request_history(request)
+        # 调用模型（无需改写或命中缓存时不会请求模型）
+        rewritten_query, rewrite_path, prompt_tokens = await call_rewrite_model(history_qas, current_question)
         
         return QueryRewriteResponse(
             original_query=current_question,
             rewritten_query=rewritten_query,
             success=True,
-            timestamp=request.context.timestamp if request.context else None
+            timestamp=request.context.timestamp if request.context else None,
+            rewrite_path=rewrite_path,
+            prompt_tokens=prompt_tokens
         )
         
     except HTTPException:
@@ -151,78 +383,180 @@ async def rewrite_query(request: QueryRewriteRequest):
         raise HTTPException(status_code=500, detail=f"模型调用失败: {str(e)}")
 
 
-@app.post("/api/batch-rewrite")
-async def batch_rewrite(requests: list[QueryRewriteRequest]):
+@app.post("/api/rewrite/stream")
+async def rewrite_query_stream(request: QueryRewriteRequest):
     """
-    批量查询改写接口
-    
-    一次处理多个查询改写请求
+    流式查询改写接口（Server-Sent Events）
+
+    模型生成过程中逐段推送 delta 事件（data: {"text": 新增文本}），下游可据此提前开始检索；
+    结束时推送 result 事件，data 为完整的 QueryRewriteResponse。
+    无需改写或命中缓存时直接推送 result 事件；出错时推送 error 事件（data: {"detail": 错误信息}）。
     """
-    results = []
-    for req in requests:
+    history_qas, current_question = _request_history(request)
+
+    async def events():
         try:
-            if not req.param_pairs:
-                results.append({
-                    "original_query": "",
-                    "rewritten_query": "",
-                    "success": False,
-                    "error": "param_pairs 不能为空"
-                })
-                continue
-            
-            # 获取窗口大小
-            window_size = 1
-            if req.context and req.context.window_size:
-                window_size = req.context.window_size
-            
-            # 获取所有对话对
-            recent_pairs = req.param_pairs
-            
-            # 提取历史信息和当前问题
-            if len(recent_pairs) == 0:
-                results.append({
-                    "original_query": "",
-                    "rewritten_query": "",
-                    "success": False,
-                    "error": "至少需要一轮对话"
-                })
-                continue
-            
-            # 最后一轮是当前问题
-            current_question = recent_pairs[-1].question
-            
-            # 获取历史对话（排除最后一轮当前查询）
-            if len(recent_pairs) > 1:
-                # 取最近 window_size 轮历史
-                history_qas = recent_pairs[:-1][-window_size:]
-            else:
-                # 只有一轮对话，没有历史
-                history_qas = []
-            
-            prompt = build_user_prompt(history_qas, current_question)
-            completion = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-            )
-            
-            results.append({
-                "original_query": current_question,
-                "rewritten_query": completion.choices[0].message.content.strip(),
-                "success": True
-            })
+            async for event, payload in stream_rewrite_model(history_qas, current_question):
+                if event == "delta":
+                    yield _sse_event("delta", {"text": payload})
+                    continue
+                rewritten_query, rewrite_path, prompt_tokens = payload
+                response = QueryRewriteResponse(
+                    original_query=current_question,
+                    rewritten_query=rewritten_query,
+                    success=True,
+                    timestamp=request.context.timestamp if request.context else None,
+                    rewrite_path=rewrite_path,
+                    prompt_tokens=prompt_tokens
+                )
+                yield _sse_event("result", response.model_dump())
         except Exception as e:
-            results.append({
-                "original_query": req.param_pairs[-1].question if req.param_pairs else "",
+            yield _sse_event("error", {"detail": f"模型调用失败: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 关闭代理缓冲，保证事件实时送达
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _run_batch(requests: list, handle_item, max_concurrency: int) -> dict:
+    """
+    批量接口的公共执行逻辑：各条请求在并发上限内同时处理，结果顺序与请求顺序一致
+
+    handle_item 需把单条请求的错误转换为结果返回，单条失败不影响其它请求。
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(req) -> dict:
+        async with semaphore:
+            return await handle_item(req)
+
+    results = await asyncio.gather(*(run(req) for req in requests))
+    return {"results": list(results), "total": len(results)}
+
+
+async def _rewrite_batch_item(req: QueryRewriteRequest) -> dict:
+    """处理批量请求中的单条改写，错误以结果形式返回而不抛出"""
+    try:
+        if not req.param_pairs:
+            return {
+                "original_query": "",
                 "rewritten_query": "",
                 "success": False,
-                "error": str(e)
-            })
+                "error": "param_pairs 不能为空"
+            }
+        
+        # 获取窗口大小
+        window_size = 1
+        if req.context and req.context.window_size:
+            window_size = req.context.window_size
+        
+        # 获取所有对话对
+        recent_pairs = req.param_pairs
+        
+        # 最后一轮是当前问题
+        current_question = recent_pairs[-1].question
+        
+        # 获取历史对话（排除最后一轮当前查询）
+        if len(recent_pairs) > 1:
+            # 取最近 window_size 轮历史
+            history_qas = recent_pairs[:-1][-window_size:]
+        else:
+            # 只有一轮对话，没有历史
+            history_qas = []
+        
+        rewritten_query, rewrite_path, prompt_tokens = await call_rewrite_model(history_qas, current_question)
+        return {
+            "original_query": current_question,
+            "rewritten_query": rewritten_query,
+            "success": True,
+            "rewrite_path": rewrite_path,
+            "prompt_tokens": prompt_tokens
+        }
+    except Exception as e:
+        return {
+            "original_query": req.param_pairs[-1].question if req.param_pairs else "",
+            "rewritten_query": "",
+            "success": False,
+            "error": str(e)
+        }
+
+
+@app.post("/api/batch-rewrite")
+async def batch_rewrite(
+    requests: list[QueryRewriteRequest],
+    max_concurrency: int = Query(
+        BATCH_MAX_CONCURRENCY, ge=1, le=512, description="同时在途的模型调用数上限"
+    ),
+):
+    """
+    批量查询改写接口
     
-    return {"results": results, "total": len(results)}
+    一次处理多个查询改写请求，各条请求在并发上限内同时调用模型，
+    结果顺序与请求顺序一致，单条失败不影响其它请求
+    """
+    return await _run_batch(requests, _rewrite_batch_item, max_concurrency)
+
+
+@app.post("/api/sub-questions", response_model=SubQuestionsResponse)
+async def sub_questions(request: SubQuestionsRequest):
+    """
+    子问题拆解接口
+
+    判断查询复杂度：简单问题原样返回，复杂问题拆解为子问题列表
+    """
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="查询内容不能为空")
+    try:
+        result, cached = await call_sub_questions(request.query)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"模型调用失败: {str(e)}")
+    if not result.tasks:
+        raise HTTPException(status_code=500, detail="模型输出不是有效的JSON格式")
+    return SubQuestionsResponse(
+        query=request.query,
+        is_complex=result.is_complex,
+        sub_questions=result.tasks,
+        cached=cached,
+        complete=result.complete,
+    )
+
+
+async def _sub_questions_batch_item(req: SubQuestionsRequest) -> dict:
+    """处理批量请求中的单条拆解，错误以结果形式返回而不抛出"""
+    try:
+        if not req.query or not req.query.strip():
+            return {"query": req.query, "sub_questions": [], "success": False, "error": "查询内容不能为空"}
+        result, cached = await call_sub_questions(req.query)
+        if not result.tasks:
+            return {"query": req.query, "sub_questions": [], "success": False, "error": "模型输出不是有效的JSON格式"}
+        return {
+            "query": req.query,
+            "is_complex": result.is_complex,
+            "sub_questions": result.tasks,
+            "cached": cached,
+            "complete": result.complete,
+            "success": True
+        }
+    except Exception as e:
+        return {"query": req.query, "sub_questions": [], "success": False, "error": str(e)}
+
+
+@app.post("/api/batch-sub-questions")
+async def batch_sub_questions(
+    requests: list[SubQuestionsRequest],
+    max_concurrency: int = Query(
+        BATCH_MAX_CONCURRENCY, ge=1, le=512, description="同时在途的模型调用数上限"
+    ),
+):
+    """
+    批量子问题拆解接口
+
+    各条请求在并发上限内同时调用模型，结果顺序与请求顺序一致，单条失败不影响其它请求
+    """
+    return await _run_batch(requests, _sub_questions_batch_item, max_concurrency)
 
 
 @app.get("/api/risk_detect")
@@ -252,7 +586,7 @@ async def detect_risk(request: QueryRequest):
         raise HTTPException(status_code=400, detail="查询内容不能为空")
 
     try:
-        result = judge.judge_with_details(request.query)
+        result = await judge.judge_with_details(request.query, session_id=request.session_id)
 
         if result['final_result']:
             notification_content = f"检测到需要转人工服务：\n用户问题：{request.query}"
@@ -263,7 +597,7 @@ async def detect_risk(request: QueryRequest):
             elif result['matched_keywords']:
                 notification_content = f"检测到投诉风险：\n用户问题：{request.query}\n匹配关键词：{result['matched_keywords']}"
             
-            await send_wechat_group_notification(notification_content)
+            notification_dispatcher.enqueue(notification_content)
 
         return RiskResponse(
             is_risk=result['final_result'],
@@ -0,0 +1,67 @@
+"""
+normalize_text 基准测试
+对比逐字符实现与 main.normalize_text（translate 映射表）在同一份结果文件上的耗时，并校验结果一致。
+首轮从空映射表开始计时，包含映射表按需填充的开销（每个新进程都要付出这部分成本）。
+
+用法：python bench_normalize.py [CSV 路径] [重复次数]
+"""
+
+import sys
+import time
+import unicodedata
+
+from csv_stream import iter_rows
+from main import _NORMALIZE_TABLE, normalize_many, normalize_text
+
+
+def normalize_text_per_char(text):
+    """改造前的逐字符实现，作为基准"""
+    cleaned = []
+    for ch in text:
+        if ch.isspace():
+            continue
+        if unicodedata.category(ch).startswith("P"):
+            continue
+        cleaned.append(ch)
+    return "".join(cleaned)
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else "data/sample_records_1.csv"
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    texts = []
+    for row in iter_rows(csv_file):
+        texts.append(row.get("model_output", ""))
+        texts.append(row.get("rewrite", ""))
+
+    # 首轮：空映射表，与新进程中第一次评分的情况一致
+    _NORMALIZE_TABLE.clear()
+    per_char_cold_seconds, expected = timeit(lambda: [normalize_text_per_char(t) for t in texts], 1)
+    cold_seconds, cold_actual = timeit(lambda: [normalize_text(t) for t in texts], 1)
+    table_size = len(_NORMALIZE_TABLE)
+
+    per_char_seconds, expected = timeit(lambda: [normalize_text_per_char(t) for t in texts], repeat)
+    translate_seconds, actual = timeit(lambda: [normalize_text(t) for t in texts], repeat)
+    batch_seconds, batch_actual = timeit(lambda: normalize_many(texts), repeat)
+
+    if cold_actual != expected or actual != expected or batch_actual != expected:
+        raise AssertionError("translate 实现与逐字符实现结果不一致")
+
+    print(f"文件: {csv_file}，文本数: {len(texts)}，重复: {repeat} 次")
+    print(f"首轮（含映射表填充，{table_size} 个字符）: 逐字符 {per_char_cold_seconds * 1000:.1f} ms，"
+          f"normalize_text {cold_seconds * 1000:.1f} ms（{per_char_cold_seconds / cold_seconds:.1f}x）")
+    print(f"逐字符实现:     {per_char_seconds * 1000:.1f} ms")
+    print(f"normalize_text: {translate_seconds * 1000:.1f} ms（{per_char_seconds / translate_seconds:.1f}x）")
+    print(f"normalize_many: {batch_seconds * 1000:.1f} ms（{per_char_seconds / batch_seconds:.1f}x）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+流式 CSV 读写
+基于生成器逐行读取与写出，配合蓄水池抽样，使数据处理脚本在常数内存下处理大文件。
+"""
+
+import csv
+import io
+import random
+from typing import Iterable, Iterator, Optional
+
+
+def read_fieldnames(path: str, encoding: str = "utf-8") -> list[str]:
+    """只读取表头"""
+    with open(path, "r", encoding=encoding, newline="") as f:
+        return list(csv.DictReader(f).fieldnames or [])
+
+
+def iter_rows(path: str, encoding: str = "utf-8") -> Iterator[dict]:
+    """逐行读取 CSV，每行为一个 dict，文件在迭代结束后关闭"""
+    with open(path, "r", encoding=encoding, newline="") as f:
+        yield from csv.DictReader(f)
+
+
+class CsvRowWriter:
+    """
+    逐行写出 CSV 的上下文管理器，适合结果边产生边落盘的场景
+
+    Args:
+        append: True 时追加写入且不写表头
+    """
+
+    def __init__(self, path: str, fieldnames: list[str], encoding: str = "utf-8",
+                 append: bool = False):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.encoding = encoding
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def __enter__(self) -> "CsvRowWriter":
+        self._file = open(self.path, "a" if self.append else "w", encoding=self.encoding, newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        if not self.append:
+            self._writer.writeheader()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+
+    def writerow(self, row: dict):
+        self._writer.writerow(row)
+        self.count += 1
+
+    def flush(self):
+        self._file.flush()
+
+
+def write_rows(path: str, fieldnames: list[str], rows: Iterable[dict],
+               encoding: str = "utf-8", append: bool = False) -> int:
+    """
+    边迭代边写出 rows，返回写入的行数
+
+    Args:
+        append: True 时追加写入且不写表头
+    """
+    with CsvRowWriter(path, fieldnames, encoding=encoding, append=append) as writer:
+        for row in rows:
+            writer.writerow(row)
+    return writer.count
+
+
+def csv_byte_ranges(path: str, rows_per_range: int) -> list[tuple[int, int]]:
+    """
+    按记录边界把 CSV 数据部分（不含表头）切成每段约 rows_per_range 行的字节区间
+
+    以二进制逐行扫描，用引号奇偶判断记录是否结束（字段内的换行不会被当作记录边界），不解析字段。
+
+    Returns:
+        [(起始偏移, 结束偏移)]，左闭右开
+    """
+    ranges = []
+    start = None
+    rows = 0
+    pos = 0
+    in_quotes = False
+    with open(path, "rb") as f:
+        for line in f:
+            pos += len(line)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                continue
+            if start is None:
+                # 表头结束
+                start = pos
+                continue
+            rows += 1
+            if rows >= rows_per_range:
+                ranges.append((start, pos))
+                start = pos
+                rows = 0
+    if start is not None and start < pos:
+        ranges.append((start, pos))
+    return ranges
+
+
+def read_range_rows(path: str, start: int, end: int, fieldnames: list[str], encoding: str = "utf-8") -> list[dict]:
+    """读取 csv_byte_ranges 给出的一个字节区间，按 fieldnames 解析为 dict 列表"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start).decode(encoding)
+    return list(csv.DictReader(io.StringIO(data, newline=""), fieldnames=fieldnames))
+
+
+def iter_chunks(rows: Iterable, size: int) -> Iterator[list]:
+    """把行流切成不超过 size 行的块，用于批处理"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def reservoir_sample(rows: Iterable, k: int, rng: Optional[random.Random] = None) -> list:
+    """
+    蓄水池抽样：单次遍历、O(k) 内存地从任意长度的序列中等概率抽取 k 个元素
+
+    序列长度不超过 k 时按原顺序全部返回。
+    """
+    rng = rng or random
+    reservoir = []
+    for i, row in enumerate(rows):
+        if i < k:
+            reservoir.append(row)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                reservoir[j] = row
+    return reservoir
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+@Project ：prompt_based_intent
+@File    ：complexity_classifier.py
+@Date    ：2026/10/18
+本地问题复杂度预分类（两段式路由的第一段）
+基于关键词与句式特征打分，分数低于阈值的查询直接判为简单问题、原样返回，
+只有可能是复杂问题的查询才调用 LLM 拆解。阈值偏向召回复杂问题：宁可多送 LLM，也不把复杂问题误判为简单。
+标注数据按问题文本的哈希固定切分为调优集与留出集：阈值只在调优集上选择，效果只在留出集上报告。
+特征是参照整份 test_cases_500.csv 手工设计的，留出集上的数字仍可能偏乐观，
+接入新领域的查询时需要补充标注后重新评估。
+
+报告：python -m intent_recognization.complexity_classifier [--tune]
+'''
+import argparse
+import hashlib
+import os
+import re
+
+# (特征名, 正则, 权重)：正权重倾向复杂，负权重倾向简单
+FEATURES = [
+    # 以任务型动词开头：分析/设计/制定/撰写……，"如何"开头的方法类问题
+    ("task_verb_start", re.compile(r"^(帮我|请|请你)?(对比)?(分析|设计|制定|撰写|策划|规划|构建|建立|评估)"), 3.0),
+    ("how_start", re.compile(r"^(我想知道|请问)?如何"), 2.0),
+    # 经营、市场类主题词
+    ("business_topic", re.compile(
+        r"策略|方案|战略|体系|机制|趋势|前景|营销|推广|推销|竞争|格局|商业|行业|市场|品牌|渠道|运营|生态|挑战|机遇|规划|路线图"
+    ), 1.5),
+    # 两个对象的选择/对比（"怎么选""哪个更适合""对比"，或不带问号的"X与Y差异"）
+    ("choice_compare", re.compile(
+        r"(和|与|跟|vs|VS).+(怎么选|哪个更适合|哪个更值得|对比)|对比.+(哪个|怎么选)|(和|与|跟|vs|VS).+(差异|差别|区别)$"
+    ), 2.0),
+    ("english_compare", re.compile(r"\b(difference|differences|compare|comparison|versus|vs)\b", re.I), 3.0),
+    # 多个问题或多个分句
+    ("multi_question", re.compile(r"[？?].+[？?]"), 2.0),
+    ("multi_clause", re.compile(r"[，,；;].{8,}"), 1.0),
+    # 单点事实、故障排查、参数差异类提问
+    ("simple_ending", re.compile(
+        r"(怎么办|怎么回事|是什么原因|什么意思|有什么区别|有什么不同|怎么样|如何|好不好|实用吗|值得买吗|吗)[？?]?$"
+    ), -1.5),
+    ("greeting", re.compile(r"^(你好|您好|hi|hello|how's it going|thanks|谢谢)", re.I), -3.0),
+]
+
+# 总分达到阈值视为可能是复杂问题（需要 LLM 拆解），默认值为调优集上 --tune 的结果，可通过环境变量调整
+COMPLEXITY_THRESHOLD = float(os.getenv("COMPLEXITY_THRESHOLD", "2.0"))
+# 留出集比例：按问题文本哈希切分，同一问题始终落在同一侧
+HOLDOUT_RATIO = 0.3
+
+
+def complexity_score(query: str) -> float:
+    """复杂度得分，越高越可能是复杂问题"""
+    query = (query or "").strip()
+    return sum(weight for _, pattern, weight in FEATURES if pattern.search(query))
+
+
+def matched_features(query: str) -> list[str]:
+    """命中的特征名，便于排查误判"""
+    query = (query or "").strip()
+    return [name for name, pattern, _ in FEATURES if pattern.search(query)]
+
+
+def is_likely_complex(query: str, threshold: float = COMPLEXITY_THRESHOLD) -> bool:
+    """是否可能是复杂问题；False 表示可直接按简单问题处理，无需调用 LLM"""
+    return complexity_score(query) >= threshold
+
+
+def is_holdout(query: str, ratio: float = HOLDOUT_RATIO) -> bool:
+    """问题是否属于留出集（只用于报告，不参与调优）"""
+    digest = hashlib.md5(query.encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 0x100000000 < ratio
+
+
+def precision_recall(labels: list[int], predictions: list[int]) -> dict:
+    """以复杂问题（1）为正类计算精确率、召回率与准确率"""
+    tp = sum(1 for y, p in zip(labels, predictions) if y == 1 and p == 1)
+    fp = sum(1 for y, p in zip(labels, predictions) if y == 0 and p == 1)
+    fn = sum(1 for y, p in zip(labels, predictions) if y == 1 and p == 0)
+    correct = sum(1 for y, p in zip(labels, predictions) if y == p)
+    return {
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "accuracy": correct / len(labels) if labels else 0.0,
+    }
+
+
+def tune_threshold(queries: list[str], labels: list[int], min_recall: float = 0.95) -> float:
+    """在复杂问题召回率不低于 min_recall 的前提下，选择送 LLM 比例最低（阈值最高）的阈值"""
+    scores = [complexity_score(q) for q in queries]
+    best = min(scores)
+    for threshold in sorted(set(scores)):
+        predictions = [1 if s >= threshold else 0 for s in scores]
+        if precision_recall(labels, predictions)["recall"] >= min_recall:
+            best = threshold
+    return best
+
+
+def _format(name: str, metrics: dict, llm_ratio: float) -> str:
+    return (f"{name:<14} 精确率 {metrics['precision']:.2%}  召回率 {metrics['recall']:.2%}  "
+            f"准确率 {metrics['accuracy']:.2%}  调用 LLM 比例 {llm_ratio:.2%}")
+
+
+def report(label_file: str, llm_result_file: str, threshold: float, holdout_ratio: float = HOLDOUT_RATIO):
+    """
+    在留出集上对比三种路径（以 is_complexity 为标注）：
+    - 当前路径：全部调用 LLM，预测取 llm_result_file 中的 varify_complexity
+    - 本地分类：只用本地分类器
+    - 两段式：本地判为简单的直接返回，其余沿用 LLM 的预测
+    """
+    import pandas as pd
+
+    df = pd.read_csv(label_file)
+    llm = pd.read_csv(llm_result_file).dropna(subset=["varify_complexity"])
+    llm_predictions = dict(zip(llm["question"], llm["varify_complexity"]))
+    df = df[df["question"].isin(llm_predictions)]
+    df = df[[is_holdout(q, holdout_ratio) for q in df["question"]]]
+
+    queries = df["question"].tolist()
+    labels = df["is_complexity"].astype(int).tolist()
+    local = [1 if is_likely_complex(q, threshold) else 0 for q in queries]
+    current = [int(llm_predictions[q]) for q in queries]
+    two_stage = [c if l else 0 for l, c in zip(local, current)]
+    llm_ratio = sum(local) / len(local) if local else 0.0
+
+    print(f"标注文件: {label_file}，LLM 结果: {llm_result_file}，留出集样本数: {len(queries)}，阈值: {threshold}")
+    print(_format("当前路径(LLM)", precision_recall(labels, current), 1.0))
+    print(_format("本地分类", precision_recall(labels, local), 0.0))
+    print(_format("两段式", precision_recall(labels, two_stage), llm_ratio))
+    missed = [q for q, y, l in zip(queries, labels, local) if y == 1 and not l]
+    if missed:
+        print(f"本地误判为简单的复杂问题（{len(missed)} 条）:")
+        for q in missed:
+            print(f"  {q}  {matched_features(q)}")
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="本地复杂度预分类效果报告")
+    parser.add_argument("--labels", default=os.path.join(base_dir, "test_cases_500.csv"))
+    parser.add_argument("--llm-result", default=os.path.join(base_dir, "test_cases_500_result.csv"))
+    parser.add_argument("--threshold", type=float, default=COMPLEXITY_THRESHOLD)
+    parser.add_argument("--tune", action="store_true", help="在调优集上按复杂问题召回率重新选择阈值")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--holdout-ratio", type=float, default=HOLDOUT_RATIO, help="留出集比例")
+    args = parser.parse_args()
+
+    threshold = args.threshold
+    if args.tune:
+        import pandas as pd
+
+        df = pd.read_csv(args.labels)
+        df = df[[not is_holdout(q, args.holdout_ratio) for q in df["question"]]]
+        threshold = tune_threshold(df["question"].tolist(), df["is_complexity"].astype(int).tolist(), args.min_recall)
+        print(f"调优集（{len(df)} 条）上召回率 >= {args.min_recall:.0%} 时的阈值: {threshold}")
+    report(args.labels, args.llm_result, threshold, args.holdout_ratio)
+
+
+if __name__ == '__main__':
+    main()
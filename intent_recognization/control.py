@@ -7,25 +7,98 @@
 @Author  ：wgl
 @Date    ：2026/1/29 17:38
 '''
-import json
+import os
+from collections import namedtuple
 
+from intent_recognization.complexity_classifier import is_likely_complex
+from intent_recognization.json_extract import ComplexityStreamParser, extract_json_checked, find_complexity
 from intent_recognization.prompt_template import SUB_QUESTIONS_SYSTEM_CONTENT
-from main import intent_recognize
+from llm_client import get_async_client
 
+# 在线服务使用的模型配置（与 main.py 一致，可通过环境变量覆盖）
+SUB_QUESTIONS_BASE_URL = os.getenv("SUB_QUESTIONS_BASE_URL", "https://vllm-qwen3.vertu.cn/v1")
+SUB_QUESTIONS_MODEL = os.getenv("SUB_QUESTIONS_MODEL", "/root/autodl-tmp/Qwen3-30B-A3B-Instruct-2507-Int4-W4A16")
+SUB_QUESTIONS_MAX_TOKENS = int(os.getenv("INTENT_MAX_TOKENS", "1024"))
+# 两段式路由（默认关闭）：本地预分类判为简单的查询直接返回，不调用 LLM
+SUB_QUESTIONS_LOCAL_ROUTING = os.getenv("SUB_QUESTIONS_LOCAL_ROUTING", "0") == "1"
 
-def sub_qustions_main(query, system_content) -> list:
+# 子问题拆解结果
+# tasks: 子任务列表（简单问题为 [query]，无法解析时为空）
+# is_complex: 模型是否判定为复杂问题（截断后只剩一个子任务时仍为 True）
+# complete: 模型输出是否完整解析（经过截断修复或无法解析时为 False，不应缓存）
+SubQuestionsResult = namedtuple("SubQuestionsResult", ["tasks", "is_complex", "complete"])
+
+
+def sub_qustions_main(query, system_content, local_routing=SUB_QUESTIONS_LOCAL_ROUTING) -> list:
     """根据用户的查询和系统内容，识别用户的意图。
     1, 判断问题复杂度
+      - 本地预分类判为简单的问题, 直接返回（local_routing 开启时）
       - 简单问题, 直接返回
       - 复杂问题, 问题分解
     2, 返回当前query 拆解的子任务列表
     """
+    if local_routing and not is_likely_complex(query):
+        return [query]
+
+    # 延迟导入：main 在导入时会创建同步客户端，在线服务只使用异步版本
+    from main import intent_recognize
+
     model_output = intent_recognize(query, system_content)
     tasks = sub_qustions_post_handle(model_output, query)
 
     return tasks
 
+
+async def aintent_recognize(query, system_content, stop_on_simple=False, max_retries=None) -> str:
+    """
+    intent_recognize 的异步版本，使用共享的 AsyncOpenAI 连接池，流式接收模型输出
+
+    stop_on_simple 为 True 时，一旦解析到 "complexity": "简单" 就停止生成并返回已收到的部分输出。
+    max_retries 为 SDK 内部重试次数，默认使用 llm_client.LLM_MAX_RETRIES。
+    """
+    stream = await get_async_client(SUB_QUESTIONS_BASE_URL, max_retries=max_retries).chat.completions.create(
+        model=SUB_QUESTIONS_MODEL,
+        messages=[
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": query}
+        ],
+        max_tokens=SUB_QUESTIONS_MAX_TOKENS,
+        stream=True,
+    )
+    parser = ComplexityStreamParser()
+    try:
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if parser.feed(chunk.choices[0].delta.content) == "简单" and stop_on_simple:
+                break
+    finally:
+        # 提前结束时关闭连接，服务端随即停止生成
+        await stream.close()
+    return parser.buffer
+
+
+async def asub_questions_main(query, system_content=SUB_QUESTIONS_SYSTEM_CONTENT,
+                              local_routing=SUB_QUESTIONS_LOCAL_ROUTING) -> list:
+    """sub_qustions_main 的异步版本，供在线服务调用；简单问题在 complexity 字段生成后即返回"""
+    return (await adecompose_sub_questions(query, system_content, local_routing)).tasks
+
+
+async def adecompose_sub_questions(query, system_content=SUB_QUESTIONS_SYSTEM_CONTENT,
+                                   local_routing=SUB_QUESTIONS_LOCAL_ROUTING, max_retries=None) -> SubQuestionsResult:
+    """同 asub_questions_main，返回包含复杂度与输出是否完整的 SubQuestionsResult"""
+    if local_routing and not is_likely_complex(query):
+        return SubQuestionsResult([query], False, True)
+    model_output = await aintent_recognize(query, system_content, stop_on_simple=True, max_retries=max_retries)
+    return parse_sub_questions(model_output, query)
+
+
 def sub_qustions_post_handle(model_output: str, query: str) -> list:
+    """对模型输出进行后处理，提取子任务列表（见 parse_sub_questions）"""
+    return parse_sub_questions(model_output, query).tasks
+
+
+def parse_sub_questions(model_output: str, query: str) -> SubQuestionsResult:
     """对模型输出进行后处理，提取子任务列表
     Args:
         model_output: str，模型输出内容
@@ -79,21 +152,26 @@ def sub_qustions_post_handle(model_output: str, query: str) -> list:
 }
 ```
     Returns:
-        list，子任务列表
+        SubQuestionsResult；输出被截断时只保留完整的子任务，description 为空的子任务会被丢弃
 
     """
-    if model_output.startswith("```"):
-        model_output = model_output.strip("```json").strip("```").strip()
-    try:
-        output_json = json.loads(model_output)
-        complexity = 1 if output_json.get("complexity", "") == "复杂" else 0
-        if not complexity:
-            return [query]
-        subtasks = output_json.get("subtasks", [])
-        return [i.get("description", "") for i in subtasks]
-    except json.JSONDecodeError:
+    # 简单问题只需 complexity 字段，输出不完整（如流式提前结束）也可以判断
+    if find_complexity(model_output) == "简单":
+        return SubQuestionsResult([query], False, True)
+    output_json, repaired = extract_json_checked(model_output)
+    if output_json is None:
         print("模型输出不是有效的JSON格式")
-        return []
+        return SubQuestionsResult([], False, False)
+    if output_json.get("complexity", "") != "复杂":
+        return SubQuestionsResult([query], False, not repaired)
+    subtasks = output_json.get("subtasks", [])
+    if not isinstance(subtasks, list):
+        subtasks = []
+    tasks = [
+        i["description"].strip() for i in subtasks
+        if isinstance(i, dict) and isinstance(i.get("description"), str) and i["description"].strip()
+    ]
+    return SubQuestionsResult(tasks, True, not repaired)
 
 if __name__ == '__main__':
     q_list = ["how's it going?", "what's the weather today?", "LIFE 与 AGENT Q价格差异","what's difference between LIFE and AGENT Q?","苹果收购小米对市场的影响？"]
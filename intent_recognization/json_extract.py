@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+@Project ：prompt_based_intent
+@File    ：json_extract.py
+@Date    ：2026/10/18
+容错的 JSON 提取与流式 complexity 解析
+'''
+import json
+import re
+from collections import namedtuple
+from typing import Optional
+
+# ```json ... ``` 代码块（结尾 ``` 可能缺失）
+_FENCE_PATTERN = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.S)
+# 对象/数组结尾前多余的逗号
+_TRAILING_COMMA_PATTERN = re.compile(r",(\s*[}\]])")
+# 修复截断输出时最多尝试回退的逗号数
+MAX_TRUNCATION_RETRIES = 20
+# complexity 字段，值的右引号出现后才算完整
+_COMPLEXITY_PATTERN = re.compile(r'"complexity"\s*:\s*"([^"]*)"')
+
+# value: 解析出的 dict（无法解析时为 None）；repaired: 是否经过截断修复（内容可能不完整）
+JsonExtraction = namedtuple("JsonExtraction", ["value", "repaired"])
+
+
+def _strip_fence(text: str) -> str:
+    match = _FENCE_PATTERN.search(text)
+    return match.group(1) if match else text
+
+
+def _scan_object(text: str, start: int):
+    """
+    从 start 处的 { 开始扫描，跳过字符串内容
+
+    Returns:
+        (结束位置（不含）, 未闭合的括号栈)，对象完整时栈为空
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i + 1, []
+    if in_string:
+        stack.append('"')
+    return len(text), stack
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """去掉字符串之外、} 或 ] 前多余的逗号"""
+    parts = re.split(r'("(?:\\.|[^"\\])*")', text)
+    for i in range(0, len(parts), 2):
+        parts[i] = _TRAILING_COMMA_PATTERN.sub(r"\1", parts[i])
+    return "".join(parts)
+
+
+def _open_arrays(text: str) -> tuple[list[tuple[int, int]], int]:
+    """
+    截断文本中未闭合的数组
+
+    Returns:
+        ([(数组在未闭合栈中的层级, 当前元素的起始位置)], 未闭合栈的深度（未闭合的字符串也算一层）)
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append([ch, i + 1])
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == "," and stack:
+            stack[-1][1] = i + 1
+    depth = len(stack) + (1 if in_string else 0)
+    return [(level, start) for level, (ch, start) in enumerate(stack) if ch == "["], depth
+
+
+def _drop_partial_elements(text: str) -> str:
+    """
+    丢弃截断时未写完的数组元素
+
+    数组之内还有未闭合的对象或字符串时，数组的最后一个元素是被截断的，补全括号会得到一个不完整的元素，
+    直接从该元素的起始位置截掉（取最外层这样的数组）。
+    """
+    arrays, depth = _open_arrays(text)
+    for level, start in arrays:
+        if level < depth - 1:
+            return text[:start]
+    return text
+
+
+def _close_truncated(text: str) -> str:
+    """补全截断的 JSON：丢弃未写完的数组元素，闭合字符串，去掉结尾的逗号，最后按栈逆序补上括号"""
+    text = _drop_partial_elements(text)
+    _, unclosed = _scan_object(text, 0)
+    if unclosed and unclosed[-1] == '"':
+        text += unclosed.pop()
+    return text.rstrip().rstrip(",") + "".join(reversed(unclosed))
+
+
+def _comma_positions(text: str) -> list[int]:
+    """字符串之外的逗号位置"""
+    positions = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            positions.append(i)
+    return positions
+
+
+def _loads_object(text: str) -> Optional[dict]:
+    for attempt in (text, _remove_trailing_commas(text)):
+        try:
+            value = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def extract_json(text: str) -> Optional[dict]:
+    """
+    从模型输出中提取第一个 JSON 对象，兼容常见的格式问题：
+    - 代码块标记缺失或不完整（```json、只有开头的 ```）
+    - JSON 前后的说明文字
+    - 结尾多余的逗号
+    - 输出被截断（补全未闭合的字符串与括号，丢弃未写完的数组元素）
+
+    Returns:
+        解析出的 dict，无法解析时返回 None；需要区分是否经过截断修复时使用 extract_json_checked
+    """
+    return extract_json_checked(text).value
+
+
+def extract_json_checked(text: str) -> JsonExtraction:
+    """同 extract_json，并返回结果是否经过截断修复（修复后的内容可能缺少字段或元素，不应缓存）"""
+    if not text:
+        return JsonExtraction(None, False)
+    body = _strip_fence(text)
+    start = body.find("{")
+    if start == -1:
+        return JsonExtraction(None, False)
+    end, unclosed = _scan_object(body, start)
+    candidate = body[start:end]
+    if not unclosed:
+        return JsonExtraction(_loads_object(candidate), False)
+
+    value = _loads_object(_close_truncated(candidate))
+    if value is not None:
+        return JsonExtraction(value, True)
+    # 截断在键名或取值中间时，从后往前在逗号处截掉不完整的部分再补全
+    for position in reversed(_comma_positions(candidate)[-MAX_TRUNCATION_RETRIES:]):
+        value = _loads_object(_close_truncated(candidate[:position]))
+        if value is not None:
+            return JsonExtraction(value, True)
+    return JsonExtraction(None, True)
+
+
+def find_complexity(text: str) -> Optional[str]:
+    """在（可能不完整的）模型输出中查找 complexity 字段的完整取值"""
+    match = _COMPLEXITY_PATTERN.search(text or "")
+    return match.group(1).strip() if match else None
+
+
+class ComplexityStreamParser:
+    """
+    流式输出的增量解析：每收到一段文本调用 feed，complexity 字段完整出现后立即返回其取值，
+    调用方可在判断为简单问题时提前结束生成。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.complexity = None
+
+    def feed(self, delta: str) -> Optional[str]:
+        self.buffer += delta
+        if self.complexity is None:
+            # 字段名与取值可能跨越多个片段，在累积的全部文本中查找
+            self.complexity = find_complexity(self.buffer)
+        return self.complexity
@@ -118,4 +118,5 @@ SUB_QUESTIONS_SYSTEM_CONTENT = """
 }
 """
 
-print(SUB_QUESTIONS_SYSTEM_CONTENT)
\ No newline at end of file
+if __name__ == '__main__':
+    print(SUB_QUESTIONS_SYSTEM_CONTENT)
@@ -7,64 +7,96 @@
 @Author  ：wgl
 @Date    ：2026/1/30 14:38
 '''
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
 
 import pandas as pd
 
-from intent_recognization.control import sub_qustions_main
+from adaptive_limiter import ADAPTIVE_CLIENT_MAX_RETRIES, ADAPTIVE_MAX_CONCURRENCY, AdaptiveLimiter
+from intent_recognization.complexity_classifier import is_likely_complex
+from intent_recognization.control import SubQuestionsResult, adecompose_sub_questions
 from intent_recognization.prompt_template import SUB_QUESTIONS_SYSTEM_CONTENT
 
-def get_sub_question_result():
-    test_file = "test_cases.csv"
-    df = pd.read_csv(test_file)
-    queries = df['question'].tolist()
-    # 新建测试csv
-    df_result = pd.DataFrame(columns=['question', 'is_complexity', 'varify_complexity'])
-    df_result['question'] = queries
-    df_result['is_complexity'] = df['is_complexity']
-    for q in queries:
-        sub_questions = sub_qustions_main(q, SUB_QUESTIONS_SYSTEM_CONTENT)
-        if len(sub_questions) == 1:
-            print(f"问题: {q} 是简单问题，无需拆解")
-            # 写入df_result
-            df_result.loc[df_result['question'] == q, 'varify_complexity'] = 0
-        else:
-            print(f"问题: {q} 是复杂问题，拆解为子任务:")
-            for task in sub_questions:
-                print(f"- {task}")
-            # 写入df_result
-            df_result.loc[df_result['question'] == q, 'varify_complexity'] = 1
-    df_result.to_csv("test_sub_questions_result.csv", index=False)
+# 初始并发数，运行中按服务端延迟与错误自适应调整
+DEFAULT_CONCURRENCY = 16
+
 
-def process_question(q):
-    sub_questions = sub_qustions_main(q, SUB_QUESTIONS_SYSTEM_CONTENT)
-    if len(sub_questions) == 1:
+async def process_question(q, limiter, local_routing=False):
+    """
+    返回 1（复杂）/ 0（简单）；过载重试用尽或其它错误时返回 None，不中断整个评测
+
+    默认每个问题都调用 LLM，评测的是模型本身；local_routing 为 True 时评测两段式路由（不受 SUB_QUESTIONS_LOCAL_ROUTING 影响）。
+    """
+    if local_routing and not is_likely_complex(q):
+        # 本地判为简单的问题不调用模型，不占用并发名额，也不计入延迟统计
+        result = SubQuestionsResult([q], False, True)
+    else:
+        try:
+            result = await limiter.run(lambda: adecompose_sub_questions(
+                q, SUB_QUESTIONS_SYSTEM_CONTENT, local_routing=False, max_retries=ADAPTIVE_CLIENT_MAX_RETRIES
+            ))
+        except Exception as e:
+            print(f"问题: {q} 处理失败: {e}")
+            return None
+    # 以模型判定的复杂度为准：输出被截断时复杂问题可能只剩一个子任务
+    if not result.is_complex:
         print(f"问题: {q} 是简单问题，无需拆解")
         return 0
     else:
         print(f"问题: {q} 是复杂问题，拆解为子任务:")
-        for task in sub_questions:
+        for task in result.tasks:
             print(f"- {task}")
         return 1
 
-def batch_get_sub_question_result(file_path,target_file_path):
+
+async def evaluate_questions(queries, concurrency=DEFAULT_CONCURRENCY, max_concurrency=ADAPTIVE_MAX_CONCURRENCY,
+                             adaptive=True, local_routing=False):
+    """并发判断每个问题的复杂度，结果按 queries 的位置返回（重复问题各自独立计算）"""
+    limiter = AdaptiveLimiter(concurrency, max_limit=max_concurrency, adaptive=adaptive, name="复杂度评测")
+    results = await asyncio.gather(*(process_question(q, limiter, local_routing) for q in queries))
+    limiter.print_summary()
+    return results
+
+
+def batch_get_sub_question_result(file_path, target_file_path, concurrency=DEFAULT_CONCURRENCY,
+                                  max_concurrency=ADAPTIVE_MAX_CONCURRENCY, adaptive=True, local_routing=False):
     df = pd.read_csv(file_path)
     queries = df['question'].tolist()
-    df_result = pd.DataFrame(columns=['question', 'is_complexity', 'varify_complexity'])
-    df_result['question'] = queries
-    df_result['is_complexity'] = df['is_complexity']
-    with ThreadPoolExecutor(max_workers=50) as executor:
-        results = list(executor.map(process_question, queries))
-    df_result['varify_complexity'] = results
-    # 计算并打印准确率varify_complexity = is_complexity的准确率
-    accuracy = (df_result['is_complexity'] == df_result['varify_complexity']).mean()
+    results = asyncio.run(evaluate_questions(queries, concurrency, max_concurrency, adaptive, local_routing))
+    # 结果按位置对应，一次性组装
+    df_result = pd.DataFrame({
+        'question': queries,
+        'is_complexity': df['is_complexity'],
+        'varify_complexity': results,
+    })
+    # 计算并打印准确率varify_complexity = is_complexity的准确率（调用失败的问题不计入）
+    evaluated = df_result[df_result['varify_complexity'].notna()]
+    accuracy = (evaluated['is_complexity'] == evaluated['varify_complexity']).mean()
     print(f"复杂度识别准确率: {accuracy * 100:.2f}%")
+    failed = len(df_result) - len(evaluated)
+    if failed:
+        print(f"{failed} 个问题调用失败，未计入准确率，varify_complexity 为空")
     df_result.to_csv(target_file_path, index=False)
-    # df_result.to_csv("test_sub_questions_result.csv", index=False)
+
+
+def get_sub_question_result():
+    """逐条评测 test_cases.csv（并发数固定为 1）"""
+    batch_get_sub_question_result("test_cases.csv", "test_sub_questions_result.csv", concurrency=1, adaptive=False)
 
 
 if __name__ == '__main__':
-    # test_file = "test_cases.csv"
-    test_file = "test_cases_100.csv"
-    target_file_path = test_file.replace(".csv", "_result.csv")
-    batch_get_sub_question_result(test_file, target_file_path)
+    parser = argparse.ArgumentParser(description="子问题拆解复杂度评测")
+    parser.add_argument("--input", default="test_cases_100.csv")
+    parser.add_argument("--output", default=None, help="默认在输入文件名后加 _result")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="初始并发数")
+    parser.add_argument("--max-concurrency", type=int, default=ADAPTIVE_MAX_CONCURRENCY, help="自适应并发的上限")
+    parser.add_argument("--no-adaptive", action="store_true", help="固定使用 --concurrency，不自适应调整")
+    parser.add_argument("--local-routing", action="store_true",
+                        help="评测两段式路由：本地判为简单的问题不调用 LLM（默认全部走 LLM）")
+    args = parser.parse_args()
+
+    target_file_path = args.output or args.input.replace(".csv", "_result.csv")
+    batch_get_sub_question_result(
+        args.input, target_file_path, args.concurrency, args.max_concurrency, adaptive=not args.no_adaptive,
+        local_routing=args.local_routing,
+    )
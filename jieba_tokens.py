@@ -0,0 +1,140 @@
+"""
+jieba 分词批处理与持久化缓存
+对批量文本先去重、查缓存，再把未命中的文本一次性交给 jieba（可开启多进程并行模式），
+结果按 文本哈希 + jieba 词典版本 存入 SQLite，跨运行、跨文件复用。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Iterable, Optional
+
+import jieba
+
+
+# jieba 并行模式按行切分输入，含换行符的文本需要单独分词
+_LINE_BREAKS = "\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+_dictionary_version = None
+
+
+def clean_tokens(tokens: Iterable[str]) -> list[str]:
+    """去掉空白 token 并去除首尾空白"""
+    cleaned = []
+    for token in tokens:
+        token = (token or "").strip()
+        if token:
+            cleaned.append(token)
+    return cleaned
+
+
+def jieba_exact_tokens(text: str) -> list[str]:
+    return clean_tokens(jieba.cut(text, cut_all=False))  # 精确模式
+
+
+def dictionary_version() -> str:
+    """jieba 版本 + 主词典内容哈希，词典变化后缓存自动失效"""
+    global _dictionary_version
+    if _dictionary_version is None:
+        h = hashlib.md5()
+        with jieba.dt.get_dict_file() as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _dictionary_version = f"{jieba.__version__}:{h.hexdigest()}"
+    return _dictionary_version
+
+
+class TokenCache:
+    """SQLite 持久化分词缓存"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # 多个进程可能同时写同一个缓存文件，加长锁等待时间
+        self._db = sqlite3.connect(db_path, timeout=30)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jieba_tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha1(f"{dictionary_version()}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list[str]) -> dict[str, list[str]]:
+        found = {}
+        keys = {self.make_key(text): text for text in texts}
+        key_list = list(keys)
+        # SQLite 单条语句的参数数量有限，分批查询
+        for i in range(0, len(key_list), 500):
+            batch = key_list[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, tokens in self._db.execute(
+                f"SELECT key, tokens FROM jieba_tokens WHERE key IN ({placeholders})", batch
+            ):
+                found[keys[key]] = json.loads(tokens)
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def set_many(self, items: dict[str, list[str]]):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO jieba_tokens (key, tokens) VALUES (?, ?)",
+            [(self.make_key(text), json.dumps(tokens, ensure_ascii=False)) for text, tokens in items.items()],
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def _tokenize_joined(texts: list[str]) -> list[list[str]]:
+    """把不含换行的文本用换行拼成一段整体分词，再按换行 token 拆回各条文本"""
+    results = [[]]
+    for token in jieba.cut("\n".join(texts), cut_all=False):
+        if token == "\n":
+            results.append([])
+        else:
+            results[-1].append(token)
+    return [clean_tokens(tokens) for tokens in results]
+
+
+def batch_tokenize(texts: Iterable[str], cache: Optional[TokenCache] = None) -> dict[str, list[str]]:
+    """
+    批量分词：去重 -> 查缓存 -> 对未命中的文本统一分词 -> 写回缓存
+
+    需要多进程并行时，先调用 enable_parallel。
+
+    Returns:
+        {文本: token 列表}
+    """
+    unique = list(dict.fromkeys(texts))
+    tokens_by_text = cache.get_many(unique) if cache is not None else {}
+    missing = [text for text in unique if text not in tokens_by_text]
+    if not missing:
+        return tokens_by_text
+
+    joinable = [text for text in missing if not any(ch in text for ch in _LINE_BREAKS)]
+    computed = dict(zip(joinable, _tokenize_joined(joinable))) if joinable else {}
+    for text in missing:
+        if text not in computed:
+            computed[text] = jieba_exact_tokens(text)
+
+    if cache is not None:
+        cache.set_many(computed)
+    tokens_by_text.update(computed)
+    return tokens_by_text
+
+
+def enable_parallel(processes: int):
+    """开启 jieba 多进程并行分词（仅 POSIX 系统支持，processes<=1 时不开启）"""
+    if processes > 1 and os.name == "posix":
+        jieba.enable_parallel(processes)
+
+
+def disable_parallel():
+    """关闭并行模式并回收进程池"""
+    if jieba.pool is not None:
+        jieba.disable_parallel()
@@ -0,0 +1,157 @@
+"""
+异步 LLM 客户端
+为在线服务（api.py、risk_detect）提供共享的 AsyncOpenAI 客户端，
+连接池大小、超时与 keep-alive 均可通过环境变量配置。
+另提供分类调用辅助函数 classify / classify_sync：只需输出 true/false、0/1 这类短标签的调用
+统一限制 max_tokens、设置停止符并解析标签，避免模型偶尔生成长文本拖慢解码。
+"""
+
+import os
+from collections import namedtuple
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+# 连接池配置：单个 worker 需要同时保持数百个 vLLM 请求在途
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "512"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "128"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# 超时配置（秒）
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "30"))
+
+# SDK 层面的重试次数
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# 按 (base_url, api_key, max_retries) 复用客户端，每个组合各有一个连接池
+_clients: dict[tuple[str, str, int], AsyncOpenAI] = {}
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        LLM_READ_TIMEOUT,
+        connect=LLM_CONNECT_TIMEOUT,
+        pool=LLM_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+def get_async_client(base_url: str, api_key: str = "EMPTY", max_retries: Optional[int] = None) -> AsyncOpenAI:
+    """
+    获取指定地址的共享 AsyncOpenAI 客户端
+
+    Args:
+        base_url: OpenAI 兼容接口根路径（通常以 /v1 结尾）
+        api_key: API Key，本地模型使用占位符
+        max_retries: SDK 内部重试次数，默认 LLM_MAX_RETRIES。批量评测使用自适应并发时设为 0，
+            让 429/5xx 直接交给 AdaptiveLimiter 降低并发后再重试
+    """
+    max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+    key = (base_url, api_key, max_retries)
+    client = _clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=_build_http_client(),
+            max_retries=max_retries,
+        )
+        _clients[key] = client
+    return client
+
+
+async def close_async_clients():
+    """关闭所有共享客户端（服务退出时调用）"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
+
+
+
+# 分类调用：标签最多几个 token，留少量余量给空白
+CLASSIFY_MAX_TOKENS = int(os.getenv("LLM_CLASSIFY_MAX_TOKENS", "4"))
+CLASSIFY_STOP = ["\n"]
+# vLLM 的 guided_choice 约束解码，开启后模型只能输出给定标签之一（需要服务端支持）
+CLASSIFY_GUIDED_CHOICE = os.getenv("LLM_GUIDED_CHOICE", "0") == "1"
+
+# label 为解析出的标签（无法解析时为默认值），logprob 为生成 token 的对数概率之和（服务端未返回时为 None），raw 为原始输出
+ClassifyResult = namedtuple("ClassifyResult", ["label", "logprob", "raw"])
+
+
+def parse_label(text: str, labels: list[str]) -> Optional[str]:
+    """从模型输出中解析标签：完全一致优先，其次取最先出现的标签，均不匹配时返回 None"""
+    text = (text or "").strip().lower()
+    for label in labels:
+        if text == label.lower():
+            return label
+    found = [(text.find(label.lower()), label) for label in labels if label.lower() in text]
+    return min(found)[1] if found else None
+
+
+def _classify_params(labels: list[str], temperature: float, max_tokens: int,
+                     logit_bias: Optional[dict], guided_choice: bool) -> dict:
+    params = {
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stop": CLASSIFY_STOP,
+        "logprobs": True,
+    }
+    if logit_bias:
+        params["logit_bias"] = logit_bias
+    if guided_choice:
+        params["extra_body"] = {"guided_choice": labels}
+    return params
+
+
+def _classify_result(completion, labels: list[str], default: Optional[str]) -> ClassifyResult:
+    choice = completion.choices[0]
+    raw = choice.message.content or ""
+    logprob = None
+    if choice.logprobs is not None and choice.logprobs.content:
+        logprob = sum(token.logprob for token in choice.logprobs.content)
+    label = parse_label(raw, labels)
+    return ClassifyResult(label if label is not None else default, logprob, raw)
+
+
+async def classify(client: AsyncOpenAI, model: str, messages: list[dict], labels: list[str],
+                   default: Optional[str] = None, temperature: float = 0,
+                   max_tokens: int = CLASSIFY_MAX_TOKENS, logit_bias: Optional[dict] = None,
+                   guided_choice: bool = CLASSIFY_GUIDED_CHOICE) -> ClassifyResult:
+    """
+    短标签分类调用
+
+    Args:
+        labels: 允许的标签，如 ["true", "false"]
+        default: 输出无法解析时使用的标签
+        logit_bias: {token_id: bias}，token id 与模型分词器相关，由调用方提供
+        guided_choice: 是否通过 vLLM guided_choice 约束输出
+    """
+    completion = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        **_classify_params(labels, temperature, max_tokens, logit_bias, guided_choice),
+    )
+    return _classify_result(completion, labels, default)
+
+
+def classify_sync(client: OpenAI, model: str, messages: list[dict], labels: list[str],
+                  default: Optional[str] = None, temperature: float = 0,
+                  max_tokens: int = CLASSIFY_MAX_TOKENS, logit_bias: Optional[dict] = None,
+                  guided_choice: bool = CLASSIFY_GUIDED_CHOICE) -> ClassifyResult:
+    """classify 的同步版本，供离线评测脚本使用"""
+    completion = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        **_classify_params(labels, temperature, max_tokens, logit_bias, guided_choice),
+    )
+    return _classify_result(completion, labels, default)
@@ -1,10 +1,19 @@
-import csv
+import argparse
+import asyncio
+import itertools
+import json
 import os
+import sys
 import unicodedata
+from functools import partial
 import dotenv
 
 from openai import OpenAI
-from prompt_templates import SYSTEM_PROMPT, build_user_prompt
+from adaptive_limiter import ADAPTIVE_CLIENT_MAX_RETRIES, ADAPTIVE_MAX_CONCURRENCY, AdaptiveLimiter
+from csv_stream import CsvRowWriter, iter_rows, read_fieldnames, read_range_rows, write_rows
+from llm_client import get_async_client
+from prompt_templates import build_messages
+from sharding import map_chunks, map_csv_ranges
 
 dotenv.load_dotenv()
 
@@ -26,6 +35,9 @@ MODEL_NAME = "/root/autodl-tmp/Qwen3-30B-A3B-Instruct-2507-Int4-W4A16"
 # 初始化客户端
 client = OpenAI(api_key="EMPTY", base_url=BASE_URL)
 
+# 意图识别只输出一段 JSON（复杂度 + 子任务列表），限制生成长度，避免偶发的长文本拖慢解码
+INTENT_MAX_TOKENS = int(os.getenv("INTENT_MAX_TOKENS", "1024"))
+
 def call_qianwen(history_qas, question):
     """·
     将 history_qas（历史对话列表）和 question 拼接后作为千问大模型的输入，
@@ -35,14 +47,9 @@ def call_qianwen(history_qas, question):
         history_qas: list，每个元素需有 question 和 answer 属性
         question: str，当前查询
     """
-    prompt = build_user_prompt(history_qas, question)
-    
     completion = client.chat.completions.create(
         model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt}
-        ],
+        messages=build_messages(history_qas, question),
     )
 
     return completion.choices[0].message.content
@@ -61,22 +68,41 @@ def intent_recognize(query, intent_system_content):
             {"role": "system", "content": intent_system_content},
             {"role": "user", "content": query}
         ],
+        max_tokens=INTENT_MAX_TOKENS,
     )
 
     return completion.choices[0].message.content
 
+class _NormalizeTable(dict):
+    """
+    str.translate 映射表：空白字符与标点符号（类别 P*）映射为 None，其余字符映射为自身
+
+    不预先遍历全部 Unicode 码位，每个字符首次出现时计算并缓存（str.translate 会调用 __missing__），
+    表的大小只与文本中出现过的不同字符数有关。
+    """
+
+    def __missing__(self, code):
+        ch = chr(code)
+        value = None if ch.isspace() or unicodedata.category(ch).startswith("P") else code
+        self[code] = value
+        return value
+
+_NORMALIZE_TABLE = _NormalizeTable()
+
 def normalize_text(text):
     """
     去掉空白字符和所有 Unicode 标点符号。
     """
-    cleaned = []
-    for ch in text:
-        if ch.isspace():
-            continue
-        if unicodedata.category(ch).startswith("P"):
-            continue
-        cleaned.append(ch)
-    return "".join(cleaned)
+    return text.translate(_NORMALIZE_TABLE)
+
+def normalize_many(texts):
+    """批量版 normalize_text，返回列表"""
+    table = _NORMALIZE_TABLE
+    return [text.translate(table) for text in texts]
+
+def is_correct(model_output, rewrite):
+    """去掉空格和标点后，模型输出与 rewrite 完全一致则计为正确"""
+    return normalize_text(model_output) == normalize_text(rewrite)
 
 def compute_accuracy(model_outputs, golden_rewrites):
     """
@@ -87,94 +113,250 @@ def compute_accuracy(model_outputs, golden_rewrites):
 
     correct = 0
     for model_output, rewrite in zip(model_outputs, golden_rewrites):
-        normalized_rewrite = normalize_text(rewrite)
-        normalized_model_output = normalize_text(model_output)
-        if normalized_model_output == normalized_rewrite:
+        if is_correct(model_output, rewrite):
             correct += 1
 
     return correct / len(golden_rewrites)
 
-def main():
-    # 假设 CSV 文件名为 data/sampled_data_1.csv，编码为 UTF-8
-    csv_file = os.path.join("data", "sampled_data_only_pos.csv")
-    output_file = os.path.join("data", "sample_records_only_pos_qwen_30b.csv")
-    
-    # 存放模型输出的列表
-    model_outputs = []
-    # 存放原始 rewrite 列的列表
-    golden_rewrites = []
-    # 存放用于展示的样本记录
-    sample_records = []
-    
-    # 读取 CSV，有表头：history1,history2,question,rewrite
-    with open(csv_file, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-
-    for idx, row in enumerate(rows, start=1):
-        # if idx > 500:
-        #     break
-        history1 = row["history1"]
-        history2 = row["history2"]
-        question = row["question"]
-        rewrite = row["rewrite"]
-
-        # 构造历史对话列表，使用简单的对象来存储
-        class HistoryItem:
-            def __init__(self, question, answer):
-                self.question = question
-                self.answer = answer
-        
-        history_qas = [HistoryItem(history1, history2)]
-        
-        # 调用模型获取输出
-        model_reply = call_qianwen(history_qas, question)
-
-        model_outputs.append(model_reply)
-        golden_rewrites.append(rewrite)
-
-        sample_records.append(
-            {
-                "history1": history1,
-                "history2": history2,
-                "question": question,
-                "model_output": model_reply,
-                "rewrite": rewrite,
-            }
+# 多进程评分时每个分片的行数
+SCORE_CHUNK_SIZE = 5000
+
+def _is_summary_row(record):
+    """结果文件末尾的准确率汇总行"""
+    return not record["question"] and not record["rewrite"] and not record["model_output"]
+
+def score_chunk(records):
+    """对一个分片评分，返回 (正确数, 样本数)"""
+    correct = 0
+    total = 0
+    for record in records:
+        if _is_summary_row(record):
+            continue
+        total += 1
+        if is_correct(record["model_output"], record["rewrite"]):
+            correct += 1
+    return correct, total
+
+def score_range(path, start, end, fieldnames):
+    """对结果文件的一个字节区间评分（在工作进程中读取并解析）"""
+    return score_chunk(read_range_rows(path, start, end, fieldnames))
+
+def score_file(path, workers=1):
+    """
+    流式读取结果文件并计算准确率
+
+    workers>1 时按记录边界把文件切成字节区间，各进程自行读取、解析并评分，主进程只传递偏移；
+    各区间结果按顺序累加，与单进程结果一致。
+
+    Returns:
+        (正确数, 样本数)
+    """
+    if workers <= 1:
+        results = map_chunks(score_chunk, iter_rows(path), SCORE_CHUNK_SIZE)
+    else:
+        results = map_csv_ranges(
+            partial(score_range, fieldnames=read_fieldnames(path)), path, SCORE_CHUNK_SIZE, workers
         )
-        
-    
+    correct = 0
+    total = 0
+    for chunk_correct, chunk_total in results:
+        correct += chunk_correct
+        total += chunk_total
+    return correct, total
+
+class HistoryItem:
+    """历史对话项，提供 build_messages 需要的 question / answer 属性"""
+    def __init__(self, question, answer):
+        self.question = question
+        self.answer = answer
+
+
+OUTPUT_FIELDNAMES = ["history1", "history2", "question", "rewrite", "model_output", "accuracy"]
+
+
+async def acall_qianwen(history_qas, question, max_retries=None):
+    """call_qianwen 的异步版本，使用共享的 AsyncOpenAI 连接池；max_retries 为 SDK 内部重试次数"""
+    completion = await get_async_client(BASE_URL, max_retries=max_retries).chat.completions.create(
+        model=MODEL_NAME,
+        messages=build_messages(history_qas, question),
+    )
+
+    return completion.choices[0].message.content
+
+
+def _count_output_rows(output_file):
+    """统计结果文件中已写入的样本行数（结果按输入顺序追加，行数即已完成的输入行数）"""
+    return sum(1 for _ in iter_rows(output_file))
+
+
+def _load_checkpoint(checkpoint_file):
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(checkpoint_file, input_file, completed, finished=False):
+    tmp_file = checkpoint_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"input": input_file, "completed": completed, "finished": finished}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+async def _rewrite_row(idx, row, limiter):
+    """改写一行；过载错误由 limiter 降低并发后重试，最终失败时记录空的 model_output 并继续"""
+    history_qas = [HistoryItem(row["history1"], row["history2"])]
+    try:
+        model_reply = await limiter.run(
+            lambda: acall_qianwen(history_qas, row["question"], max_retries=ADAPTIVE_CLIENT_MAX_RETRIES)
+        )
+    except Exception as e:
+        print(f"第 {idx} 行改写失败: {e}")
+        model_reply = ""
+    return {
+        "history1": row["history1"],
+        "history2": row["history2"],
+        "question": row["question"],
+        "model_output": model_reply,
+        "rewrite": row["rewrite"],
+        "accuracy": "",
+    }
+
+
+async def run_evaluation(csv_file, output_file, concurrency=16, resume=True, workers=1,
+                         max_concurrency=ADAPTIVE_MAX_CONCURRENCY, adaptive=True):
+    """
+    并发调用模型改写 csv_file 中的每一行，按输入顺序追加写入 output_file
+
+    结果文件本身即进度：每完成一段连续的行就追加写入并刷新，同时更新 <output_file>.ckpt；
+    中断后重新运行会跳过已写入的行，从下一行继续。
+
+    Args:
+        csv_file: 输入 CSV，表头 history1,history2,question,rewrite
+        output_file: 输出 CSV
+        concurrency: 初始并发数，运行中在 [1, max_concurrency] 内按延迟与错误自适应调整
+        resume: 是否从上次中断处继续
+        workers: 计算准确率时使用的进程数
+        adaptive: False 时固定使用 concurrency
+    """
+    checkpoint_file = output_file + ".ckpt"
+    checkpoint = _load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint and checkpoint.get("input") != csv_file:
+        print(f"检查点对应的输入文件为 {checkpoint.get('input')}，与 {csv_file} 不一致，重新开始")
+        checkpoint = None
+    if checkpoint and checkpoint.get("finished"):
+        print(f"{output_file} 已完成，无需重新运行（删除 {checkpoint_file} 或使用 --no-resume 可重新评测）")
+        return
+
+    completed = _count_output_rows(output_file) if checkpoint and os.path.exists(output_file) else 0
+    if completed:
+        print(f"从第 {completed + 1} 行继续（已完成 {completed} 行）")
+
+    limiter = AdaptiveLimiter(concurrency, max_limit=max_concurrency, adaptive=adaptive, name="改写评测")
+    # 在途任务上限，避免一次性为整个文件创建任务
+    max_pending = limiter.max_limit * 2
+
+    with CsvRowWriter(output_file, OUTPUT_FIELDNAMES, append=bool(completed)) as writer:
+        writer.flush()
+
+        next_to_write = completed + 1
+        finished_records = {}
+        pending = set()
+        rows = ((idx, row) for idx, row in enumerate(iter_rows(csv_file), start=1) if idx > completed)
+
+        def flush_ready():
+            nonlocal next_to_write
+            written = False
+            while next_to_write in finished_records:
+                writer.writerow(finished_records.pop(next_to_write))
+                if next_to_write % 100 == 0:
+                    print(f"已完成 {next_to_write} 行")
+                next_to_write += 1
+                written = True
+            if written:
+                writer.flush()
+                _save_checkpoint(checkpoint_file, csv_file, next_to_write - 1)
+
+        async def run_indexed(idx, row):
+            return idx, await _rewrite_row(idx, row, limiter)
+
+        try:
+            exhausted = False
+            while not exhausted or pending:
+                while not exhausted and len(pending) < max_pending:
+                    item = next(rows, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.create_task(run_indexed(*item)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    idx, record = task.result()
+                    finished_records[idx] = record
+                flush_ready()
+        finally:
+            for task in pending:
+                task.cancel()
+            flush_ready()
+    limiter.print_summary()
+    if limiter.failures:
+        print(f"{limiter.failures} 行调用失败，model_output 为空并计为错误；可使用 --no-resume 重新评测")
+
+    # 全部完成后，从结果文件计算准确率并追加汇总行
+    correct, total = score_file(output_file, workers)
+    sample_records = list(itertools.islice(iter_rows(output_file), 5))
+
     print("===== 完整历史 + 模型输出 + 原始 rewrite（前5条）=====")
-    for i, record in enumerate(sample_records[:5], start=1):
+    for i, record in enumerate(sample_records, start=1):
         print(f"样本 {i} -> 历史对话1：{record['history1']}")
         print(f"样本 {i} -> 历史对话2：{record['history2']}")
         print(f"样本 {i} -> Question：{record['question']}")
         print(f"样本 {i} -> 模型改写后的查询：{record['model_output']}")
         print(f"样本 {i} -> 原始 rewrite：{record['rewrite']}\n")
 
-    accuracy = compute_accuracy(model_outputs, golden_rewrites)
+    accuracy = correct / total if total else 0.0
     print(f"\n===== 准确率 =====\n{accuracy:.4f}")
 
-    fieldnames = ["history1", "history2", "question", "rewrite", "model_output", "accuracy"]
-    for record in sample_records:
-        record["accuracy"] = ""
-    with open(output_file, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(sample_records)
-        writer.writerow(
-            {
-                "history1": "",
-                "history2": "",
-                "question": "",
-                "rewrite": "",
-                "model_output": "",
-                "accuracy": accuracy,
-            }
-        )
+    summary_row = {
+        "history1": "",
+        "history2": "",
+        "question": "",
+        "rewrite": "",
+        "model_output": "",
+        "accuracy": accuracy,
+    }
+    write_rows(output_file, OUTPUT_FIELDNAMES, [summary_row], append=True)
+    _save_checkpoint(checkpoint_file, csv_file, total, finished=True)
 
     print(f"\n===== 写入结果 =====\n已写入 {output_file}")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="批量改写 + 准确率统计")
+    # 输入 CSV 表头：history1,history2,question,rewrite，编码为 UTF-8
+    parser.add_argument("--input", default=os.path.join("data", "sampled_data_only_pos.csv"))
+    parser.add_argument("--output", default=os.path.join("data", "sample_records_only_pos_qwen_30b.csv"))
+    parser.add_argument("--concurrency", type=int, default=16, help="初始并发数")
+    parser.add_argument("--max-concurrency", type=int, default=ADAPTIVE_MAX_CONCURRENCY, help="自适应并发的上限")
+    parser.add_argument("--no-adaptive", action="store_true", help="固定使用 --concurrency，不自适应调整")
+    parser.add_argument("--no-resume", action="store_true", help="忽略检查点，从头开始")
+    parser.add_argument("--workers", type=int, default=1, help="计算准确率时使用的进程数")
+    parser.add_argument("--rescore", action="store_true", help="不调用模型，只对 --output 中已有结果重新计算准确率")
+    args = parser.parse_args()
+
+    if args.rescore:
+        correct, total = score_file(args.output, args.workers)
+        accuracy = correct / total if total else 0.0
+        print(f"===== 准确率 =====\n{accuracy:.4f} ({correct}/{total})")
+        return
+
+    asyncio.run(run_evaluation(
+        args.input, args.output, args.concurrency, resume=not args.no_resume, workers=args.workers,
+        max_concurrency=args.max_concurrency, adaptive=not args.no_adaptive
+    ))
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,131 @@
+"""
+vLLM 请求微批调度
+把短时间窗口内到达的请求攒成一批，渲染为 ChatML 文本后用一次 /v1/completions 调用（prompt 为列表）提交，
+再把各条结果分发回等待的调用方。批大小由我们控制，而不是取决于请求到达的时间分布。
+
+环境变量（默认关闭）：
+- MICRO_BATCH_ENABLED：设为 1 开启
+- MICRO_BATCH_WAIT_MS：攒批窗口，毫秒（默认 10）
+- MICRO_BATCH_MAX_SIZE：单批最大请求数，攒满立即提交（默认 32）
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+from openai import AsyncOpenAI
+
+from prompt_templates import render_chatml
+
+
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "0") == "1"
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "10"))
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "32"))
+
+# ChatML 的消息结束符，vLLM 通常会作为 EOS 处理，这里显式设置以防模型继续生成
+CHATML_STOP = ["<|im_end|>"]
+
+
+class MicroBatcher:
+    """按时间窗口或批大小攒批，统一调用 completions 接口"""
+
+    def __init__(self, client: AsyncOpenAI, model: str, max_wait_ms: float = MICRO_BATCH_WAIT_MS,
+                 max_batch_size: int = MICRO_BATCH_MAX_SIZE, **completion_params):
+        """
+        Args:
+            client: 共享的 AsyncOpenAI 客户端
+            model: 模型名
+            max_wait_ms: 第一条请求到达后最多等待的毫秒数
+            max_batch_size: 单批最大请求数
+            completion_params: 同一批共用的采样参数，如 temperature、max_tokens
+        """
+        self.client = client
+        self.model = model
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.completion_params = completion_params
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending: set[asyncio.Task] = set()
+        self.batches = 0
+        self.requests = 0
+        self.max_seen_batch = 0
+        self.failures = 0
+
+    async def submit(self, messages: list[dict]) -> str:
+        """提交一条对话请求，等待所在批次返回后得到模型输出文本"""
+        text, _ = await self.submit_choice(messages)
+        return text
+
+    async def submit_choice(self, messages: list[dict]) -> tuple[str, Optional[str]]:
+        """同 submit，同时返回 finish_reason（"length" 表示输出被 max_tokens 截断）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((render_chatml(messages), future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]):
+        self.batches += 1
+        self.requests += len(batch)
+        self.max_seen_batch = max(self.max_seen_batch, len(batch))
+        try:
+            response = await self.client.completions.create(
+                model=self.model,
+                prompt=[prompt for prompt, _ in batch],
+                stop=CHATML_STOP,
+                **self.completion_params,
+            )
+        except Exception as e:
+            self.failures += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        choices = {choice.index: (choice.text, choice.finish_reason) for choice in response.choices}
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                # 调用方已取消
+                continue
+            if index in choices:
+                future.set_result(choices[index])
+            else:
+                future.set_exception(Exception(f"批量请求缺少第 {index} 条结果"))
+
+    async def drain(self):
+        """立即提交已攒的请求并等待所有批次完成（服务退出时调用）"""
+        self._flush()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_seen_batch,
+            "failures": self.failures,
+            "pending": len(self._pending),
+        }
+
+
+def create_micro_batcher(client: AsyncOpenAI, model: str, **completion_params) -> Optional[MicroBatcher]:
+    """MICRO_BATCH_ENABLED=1 时返回按环境变量配置的 MicroBatcher，否则返回 None（逐条调用 chat 接口）"""
+    if not MICRO_BATCH_ENABLED:
+        return None
+    return MicroBatcher(client, model, **completion_params)
@@ -0,0 +1,87 @@
+"""
+改写请求前缀缓存统计
+按 prompt_templates.build_messages 组装数据集中每条请求，统计共享前缀 / 可变后缀的 token 数，
+以及按 vLLM 前缀缓存块大小可复用的 token 比例。
+同时计算每条实际请求的静态前缀哈希，与固定的 EXPECTED_STATIC_PREFIX_SHA256（或 --expect-hash）比对，
+不一致时打印差异并以非零状态退出，可放在 CI 中发现前缀漂移。
+
+用法：python prompt_prefix_stats.py [--input CSV] [--block-size 16] [--max-history-tokens N] [--expect-hash SHA256] [--verbose]
+设置 PROMPT_TOKENIZER 可使用真实分词器计数（见 token_counter.py）。
+"""
+
+import argparse
+import os
+import sys
+
+from csv_stream import iter_rows
+from main import HistoryItem
+from prompt_templates import (
+    EXPECTED_STATIC_PREFIX_SHA256, build_messages, prompt_token_stats, request_prefix_sha256,
+)
+from token_counter import tokenizer_name
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计改写请求的前缀缓存友好程度")
+    parser.add_argument("--input", default=os.path.join("data", "sampled_data.csv"), help="表头含 history1,history2,question")
+    parser.add_argument("--block-size", type=int, default=16, help="vLLM 前缀缓存块大小（token 数）")
+    parser.add_argument("--max-history-tokens", type=int, default=None, help="历史对话 token 预算，不设置则保留全部历史")
+    parser.add_argument("--expect-hash", default=EXPECTED_STATIC_PREFIX_SHA256, help="期望的静态前缀 SHA256")
+    parser.add_argument("--verbose", action="store_true", help="逐条输出每个请求的统计")
+    args = parser.parse_args()
+
+    totals = []
+    suffixes = []
+    prefix_tokens = cacheable_tokens = 0
+    # 前缀哈希 -> 请求数
+    prefix_hashes = {}
+    for idx, row in enumerate(iter_rows(args.input), start=1):
+        # 跳过结果文件末尾的准确率汇总行
+        if not row["question"]:
+            continue
+        history_qas = [HistoryItem(row["history1"], row["history2"])]
+        messages = build_messages(history_qas, row["question"], args.max_history_tokens)
+        prefix_hash = request_prefix_sha256(messages)
+        prefix_hashes[prefix_hash] = prefix_hashes.get(prefix_hash, 0) + 1
+        stats = prompt_token_stats(messages, args.block_size)
+        prefix_tokens = stats["prefix_tokens"]
+        cacheable_tokens = stats["cacheable_tokens"]
+        totals.append(stats["total_tokens"])
+        suffixes.append(stats["suffix_tokens"])
+        if args.verbose:
+            print(f"{idx}\ttotal={stats['total_tokens']}\tprefix={stats['prefix_tokens']}\t"
+                  f"suffix={stats['suffix_tokens']}\tcacheable={stats['cacheable_tokens']}")
+
+    if not totals:
+        print(f"{args.input} 中没有数据")
+        return
+
+    total_sum = sum(totals)
+    totals.sort()
+    suffixes.sort()
+    print(f"文件: {args.input}，请求数: {len(totals)}，计数方式: {tokenizer_name()}，块大小: {args.block_size}")
+    print(f"静态前缀 SHA256: {', '.join(prefix_hashes)}（期望 {args.expect_hash}）")
+    print(f"共享前缀: {prefix_tokens} tokens，可缓存 {cacheable_tokens} tokens")
+    print(f"单请求 tokens: 平均 {total_sum / len(totals):.1f}，P50 {percentile(totals, 0.5)}，"
+          f"P95 {percentile(totals, 0.95)}，最大 {totals[-1]}")
+    print(f"可变后缀 tokens: 平均 {sum(suffixes) / len(suffixes):.1f}，P95 {percentile(suffixes, 0.95)}")
+    print(f"前缀缓存可复用比例: {cacheable_tokens * len(totals) / total_sum:.1%}")
+
+    drifted = {h: n for h, n in prefix_hashes.items() if h != args.expect_hash}
+    if drifted:
+        print("错误: 实际请求的静态前缀与期望哈希不一致，前缀缓存将失效：", file=sys.stderr)
+        for prefix_hash, count in drifted.items():
+            print(f"  {prefix_hash}: {count} 条请求", file=sys.stderr)
+        print("若为有意修改提示词，请同步更新 prompt_templates.EXPECTED_STATIC_PREFIX_SHA256", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
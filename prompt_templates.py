@@ -1,4 +1,14 @@
-"""Prompt templates for Qwen calls."""
+"""Prompt templates for Qwen calls.
+
+请求按固定布局组装：静态前缀（system 消息 + 用户消息开头的固定标题）在前，历史对话与当前查询在后。
+vLLM 自动前缀缓存按 token 块匹配，静态前缀必须在所有请求间逐字节一致，才能复用已计算的 KV cache、降低首 token 延迟。
+"""
+
+import hashlib
+from collections import namedtuple
+
+from token_counter import count_tokens, truncate_tokens
+
 
 SYSTEM_PROMPT = (
     "请你扮演一个智能搜索改写补全机器人，请根据User的搜索历史以及对应的搜索结果，对最后一句话先进行主语继承改写，然后进行上下文信息补全，注意：不要改变原文的意思，答案要尽可能简洁，不要直接回答该问题，不要输出多于的内容。如果检查后发现最后一句指代完整，包含完整上下文信息，那么就直接原样输出最后一句内容。不要添加额外的标点符号。\n\n"
@@ -94,9 +104,14 @@ SYSTEM_PROMPT = (
 )
 
 
-USER_PROMPT_TEMPLATE = (
+# 用户消息开头的固定标题，同样属于静态前缀
+USER_PROMPT_HEAD = (
     "# 当前任务\n"
     "## 对话历史（History）：\n"
+)
+
+USER_PROMPT_TEMPLATE = (
+    USER_PROMPT_HEAD +
     "{history_prompt}"
     "## 当前查询（Query）：\n"
     "Query:{question}\n\n"
@@ -111,17 +126,150 @@ HISTORY_PROMPT = (
     "\n\n"
 )
 
-def build_user_prompt(history_qas: list, question: str) -> str:
-    # 处理多轮历史对话
-    base_history = ""
-    for item in history_qas:
-        history1 = item.question
-        history2 = item.answer
-        base_history += HISTORY_PROMPT.format(
-            history1=history1,
-            history2=history2,
-        )
+# 静态前缀：不要在 SYSTEM_PROMPT / USER_PROMPT_HEAD 中拼接任何变量（时间、用户信息等），
+# 否则每个请求的前缀都不同，前缀缓存全部失效。
+STATIC_PREFIX = SYSTEM_PROMPT
+STATIC_PREFIX_SHA256 = hashlib.sha256(
+    (STATIC_PREFIX + "\x00" + USER_PROMPT_HEAD).encode("utf-8")
+).hexdigest()
+# 固定的前缀哈希：prompt_prefix_stats.py 用它校验实际请求的前缀。
+# 有意修改 SYSTEM_PROMPT / USER_PROMPT_HEAD 后需同步更新（线上前缀缓存会整体失效一次）
+EXPECTED_STATIC_PREFIX_SHA256 = "4b4ba7a21ba2f545162e82699f914b34cb40b1724f7549120dfb939f2b492821"
+
+# Qwen 的 ChatML 对话模板，与 vLLM /v1/chat/completions 渲染结果一致
+CHATML_MESSAGE_TEMPLATE = "<|im_start|>{role}\n{content}<|im_end|>\n"
+CHATML_GENERATION_PROMPT = "<|im_start|>assistant\n"
+
+
+def render_history_item(item) -> str:
+    return HISTORY_PROMPT.format(history1=item.question, history2=item.answer)
+
+
+def _select_history_counted(history_qas: list, max_tokens: int) -> tuple[list, int]:
+    """select_history 的实现，同时返回选中轮次的 token 总数"""
+    selected = []
+    used = 0
+    for item in reversed(history_qas):
+        tokens = count_tokens(render_history_item(item))
+        if used + tokens > max_tokens:
+            break
+        selected.append(item)
+        used += tokens
+    selected.reverse()
+    return selected, used
+
+
+def select_history(history_qas: list, max_tokens: int) -> list:
+    """
+    按 token 预算从最近一轮往前选取历史对话，返回按时间顺序排列的列表
+
+    超出预算的更早轮次被丢弃；最近一轮本身超出预算时返回空列表。
+    """
+    return _select_history_counted(history_qas, max_tokens)[0]
+
+
+# 截断后的历史对话轮次，与 ParamPair / HistoryItem 一样提供 question / answer 属性
+HistoryTurn = namedtuple("HistoryTurn", ["question", "answer"])
+
+
+def truncate_answers(history_qas: list, max_answer_tokens: int) -> list:
+    """把每轮历史中过长的 answer 截断到 max_answer_tokens 个 token（保留开头，实体通常出现在回答开头）"""
+    return [
+        HistoryTurn(item.question, truncate_tokens(item.answer, max_answer_tokens))
+        for item in history_qas
+    ]
+
+
+def build_budgeted_messages(history_qas: list, question: str, max_prompt_tokens: int,
+                            max_answer_tokens: int = None) -> tuple[list[dict], list, int]:
+    """
+    按 token 预算组装改写请求
+
+    先截断过长的回答，再从最近一轮往前选取历史，使整个请求（含静态前缀与当前查询）不超过 max_prompt_tokens；
+    当前查询本身不截断，预算不足时不带历史。
+    请求 token 数按片段累加：模板固定部分（导入时统计一次）+ 当前查询 + 选中的历史轮次，
+    不再对整段请求重复分词。片段边界处的空白被分开计数，结果可能比整段分词多 1，作为预算上限是安全的。
+
+    Returns:
+        (消息列表, 实际使用的历史轮次, 请求 token 数)
+    """
+    if max_answer_tokens is not None:
+        history_qas = truncate_answers(history_qas, max_answer_tokens)
+    base_tokens = _TEMPLATE_TOKENS + count_tokens(question)
+    selected, history_tokens = _select_history_counted(history_qas, max(0, max_prompt_tokens - base_tokens))
+    return build_messages(selected, question), selected, base_tokens + history_tokens
+
+
+def build_user_prompt(history_qas: list, question: str, max_history_tokens: int = None) -> str:
+    # 处理多轮历史对话，配置预算时只保留预算内的最近几轮
+    if max_history_tokens is not None:
+        history_qas = select_history(history_qas, max_history_tokens)
+    base_history = "".join(render_history_item(item) for item in history_qas)
     return USER_PROMPT_TEMPLATE.format(
         history_prompt=base_history,
         question=question,
     )
+
+
+def build_messages(history_qas: list, question: str, max_history_tokens: int = None) -> list[dict]:
+    """
+    改写请求的标准消息列表：静态 system 消息 + 以固定标题开头的用户消息
+
+    所有调用改写模型的地方都应使用该函数组装请求，保证前缀逐字节一致。
+    """
+    return [
+        {"role": "system", "content": STATIC_PREFIX},
+        {"role": "user", "content": build_user_prompt(history_qas, question, max_history_tokens)},
+    ]
+
+
+def request_prefix_sha256(messages: list[dict]) -> str:
+    """
+    实际请求的静态前缀哈希：system 消息 + 用户消息开头 len(USER_PROMPT_HEAD) 个字符
+
+    与 STATIC_PREFIX_SHA256 算法一致，请求前缀逐字节一致时两者相等。
+    """
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    user = next((m["content"] for m in messages if m["role"] == "user"), "")
+    return hashlib.sha256((system + "\x00" + user[:len(USER_PROMPT_HEAD)]).encode("utf-8")).hexdigest()
+
+
+def render_chatml(messages: list[dict], add_generation_prompt: bool = True) -> str:
+    """把消息列表渲染为 ChatML 文本（用于 /v1/completions 或 token 统计）"""
+    text = "".join(
+        CHATML_MESSAGE_TEMPLATE.format(role=message["role"], content=message["content"])
+        for message in messages
+    )
+    if add_generation_prompt:
+        text += CHATML_GENERATION_PROMPT
+    return text
+
+
+# 不含历史与当前查询的请求 token 数（静态前缀、固定标题与 ChatML 标记），只统计一次
+_TEMPLATE_TOKENS = count_tokens(render_chatml(build_messages([], "")))
+
+
+def shared_prefix_text() -> str:
+    """所有改写请求共享的 ChatML 前缀文本"""
+    return (
+        CHATML_MESSAGE_TEMPLATE.format(role="system", content=STATIC_PREFIX)
+        + "<|im_start|>user\n" + USER_PROMPT_HEAD
+    )
+
+
+def prompt_token_stats(messages: list[dict], block_size: int = 16) -> dict:
+    """
+    统计一次请求的 token 分布
+
+    vLLM 前缀缓存以 block_size 个 token 为一块，只有完整的块能命中，
+    cacheable_tokens 为共享前缀中可被缓存复用的 token 数。
+    """
+    total_tokens = count_tokens(render_chatml(messages))
+    prefix_tokens = count_tokens(shared_prefix_text())
+    cacheable_tokens = prefix_tokens // block_size * block_size
+    return {
+        "total_tokens": total_tokens,
+        "prefix_tokens": prefix_tokens,
+        "suffix_tokens": total_tokens - prefix_tokens,
+        "cacheable_tokens": cacheable_tokens,
+    }
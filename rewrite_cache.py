@@ -0,0 +1,226 @@
+"""
+改写结果缓存
+内存 LRU + TTL 缓存，可选 SQLite 磁盘层（重启后仍然有效）
+磁盘读写不在事件循环中执行：读取通过 asyncio.to_thread，写入由后台线程批量提交。
+"""
+
+import asyncio
+import hashlib
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class RewriteCache:
+    """
+    改写结果缓存
+
+    查找顺序：内存 LRU -> SQLite 磁盘层（若配置）；磁盘命中会回填到内存。
+    get 只查内存；aget 在内存未命中时到线程池中查磁盘层。set 只写内存并把磁盘写入交给后台线程，
+    后台线程每次取出队列中已有的全部写入、一次提交。
+    max_size 为 0 时缓存关闭，所有查找均视为未命中。
+    """
+
+    # 每写入多少次磁盘条目执行一次过期清理与容量裁剪
+    PRUNE_INTERVAL = 1000
+    # 后台线程单次提交的最大写入条数
+    WRITE_BATCH_SIZE = 500
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600,
+                 db_path: Optional[str] = None, disk_max_size: int = 1000000):
+        """
+        Args:
+            max_size: 内存层最大条目数
+            ttl: 条目有效期（秒），<=0 表示永不过期
+            db_path: SQLite 文件路径，为空时不启用磁盘层
+            disk_max_size: 磁盘层最大条目数
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_max_size = disk_max_size
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._disk_hits = 0
+        self._disk_writes = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._write_queue: queue.Queue = queue.Queue()
+        self._writer = None
+        if db_path and max_size > 0:
+            self._db = self._connect(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rewrite_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_rewrite_cache_expires ON rewrite_cache(expires_at)"
+            )
+            self._db.commit()
+            # 写入使用独立连接；WAL 模式下读取不会被写入阻塞
+            self._writer = threading.Thread(
+                target=self._write_loop, args=(self._connect(db_path),), name="rewrite-cache-writer", daemon=True
+            )
+            self._writer.start()
+
+    @staticmethod
+    def _connect(db_path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """将提示词、模型名、温度等拼接后取 sha256 作为缓存键"""
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def _expires_at(self) -> float:
+        return time.time() + self.ttl if self.ttl > 0 else float("inf")
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at > time.time():
+            self._memory.move_to_end(key)
+            return value
+        del self._memory[key]
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        """只查内存层，未命中或已过期返回 None（不访问磁盘，可在事件循环中直接调用）"""
+        if not self.enabled:
+            return None
+        value = self._get_memory(key)
+        if value is not None:
+            self._hits += 1
+        else:
+            self._misses += 1
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        """查找缓存：先查内存，未命中时在线程池中查磁盘层"""
+        if not self.enabled:
+            return None
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            row = await asyncio.to_thread(self._get_disk, key)
+            if row is not None:
+                value, expires_at = row
+                self._put_memory(key, value, expires_at)
+                self._disk_hits += 1
+        if value is not None:
+            self._hits += 1
+        else:
+            self._misses += 1
+        return value
+
+    def _get_disk(self, key: str) -> Optional[tuple[str, float]]:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, expires_at FROM rewrite_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: str):
+        """写入内存层，磁盘层写入交给后台线程（不阻塞调用方）"""
+        if not self.enabled:
+            return
+        expires_at = self._expires_at()
+        self._put_memory(key, value, expires_at)
+        if self._writer is not None:
+            # SQLite 的 REAL 无法可靠存储 inf，永不过期时写入一个足够大的值
+            disk_expires_at = expires_at if expires_at != float("inf") else 1e18
+            self._write_queue.put((key, value, disk_expires_at))
+
+    def _write_loop(self, db: sqlite3.Connection):
+        """后台写入线程：阻塞等待第一条写入，再取出队列中已有的其余写入，一次提交"""
+        try:
+            while True:
+                item = self._write_queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                stop = False
+                while len(batch) < self.WRITE_BATCH_SIZE:
+                    try:
+                        item = self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                db.executemany(
+                    "INSERT OR REPLACE INTO rewrite_cache (key, value, expires_at) VALUES (?, ?, ?)", batch
+                )
+                db.commit()
+                previous = self._disk_writes
+                self._disk_writes += len(batch)
+                if self._disk_writes // self.PRUNE_INTERVAL > previous // self.PRUNE_INTERVAL:
+                    self._prune_disk(db)
+                if stop:
+                    return
+        finally:
+            db.close()
+
+    def _put_memory(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, db: sqlite3.Connection):
+        """清理磁盘层过期条目，并按过期时间裁剪到 disk_max_size（在写入线程中执行）"""
+        db.execute("DELETE FROM rewrite_cache WHERE expires_at <= ?", (time.time(),))
+        db.execute(
+            "DELETE FROM rewrite_cache WHERE key IN ("
+            "SELECT key FROM rewrite_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_size,),
+        )
+        db.commit()
+
+    def stats(self) -> dict:
+        """命中统计，供 /health 展示"""
+        total = self._hits + self._misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._memory),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "disk_enabled": self._db is not None,
+            "hits": self._hits,
+            "disk_hits": self._disk_hits,
+            "disk_writes": self._disk_writes,
+            "pending_writes": self._write_queue.qsize(),
+            "misses": self._misses,
+            "hit_rate": round(self._hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        """提交尚未写入磁盘的条目并关闭连接"""
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -3,6 +3,7 @@ import sys
 import asyncio
 import logging
 import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional
@@ -14,15 +15,31 @@ load_dotenv()
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from llm_client import close_async_clients
 from risk_detect.judge import CustomerServiceJudge
+from risk_detect.session_store import create_tolerance_store
+from risk_detect.notifier import create_notification_dispatcher
 import uvicorn
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动通知分发任务，退出时提交剩余微批请求、发送剩余通知并关闭连接池"""
+    notification_dispatcher.start()
+    yield
+    if judge.emotion_analyzer.batcher is not None:
+        await judge.emotion_analyzer.batcher.drain()
+    await notification_dispatcher.stop()
+    await close_async_clients()
+
+
 app = FastAPI(
     title="智能客服风险检测API",
     description="基于关键词匹配和情感分析的用户查询风险检测服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 获取当前文件所在目录
@@ -37,15 +54,17 @@ try:
 except FileNotFoundError:
     print("警告：未找到keywords.txt文件，使用空关键词列表")
 
-judge = CustomerServiceJudge(keyword_list)
+judge = CustomerServiceJudge(keyword_list, tolerance_store=create_tolerance_store())
 
 
-async def send_wechat_group_notification(content: str, group_name: str = None) -> bool:
+async def send_wechat_group_notification(content: str, group_name: str = None,
+                                         client: httpx.AsyncClient = None) -> bool:
     """发送微信群通知。
     
     Args:
         content: 通知内容
         group_name: 群名称，默认从环境变量读取
+        client: 复用的 httpx 客户端，为空时临时创建
         
     Returns:
         bool: 发送是否成功
@@ -67,27 +86,36 @@ async def send_wechat_group_notification(content: str, group_name: str = None) -
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json=payload, headers=headers, params=params, timeout=10.0)
-            if resp.status_code == 200:
-                logger.info(f"✅ Notification sent to {params['nickName']}: {resp.json()}")
-                return True
-            else:
-                logger.error(f"❌ Failed to send notification: {resp.status_code} - {resp.text}")
-                return False
+        if client is None:
+            async with httpx.AsyncClient() as temp_client:
+                resp = await temp_client.post(url, json=payload, headers=headers, params=params, timeout=10.0)
+        else:
+            resp = await client.post(url, json=payload, headers=headers, params=params)
+        if resp.status_code == 200:
+            logger.info(f"✅ Notification sent to {params['nickName']}: {resp.json()}")
+            return True
+        else:
+            logger.error(f"❌ Failed to send notification: {resp.status_code} - {resp.text}")
+            return False
     except Exception as e:
         logger.error(f"❌ Error sending notification: {e}")
         return False
 
 
+# 风险通知后台分发：接口只负责入队，由后台任务合并、重试并发送
+notification_dispatcher = create_notification_dispatcher(send_wechat_group_notification)
+
+
 class QueryRequest(BaseModel):
     """用户查询请求模型"""
     query: str
+    session_id: Optional[str] = None
     
     class Config:
         json_schema_extra = {
             "example": {
-                "query": "你们的产品质量太差了，我要投诉"
+                "query": "你们的产品质量太差了，我要投诉",
+                "session_id": "user-123"
             }
         }
 
@@ -126,7 +154,7 @@ async def detect_risk(request: QueryRequest):
         raise HTTPException(status_code=400, detail="查询内容不能为空")
     
     try:
-        result = judge.judge_with_details(request.query)
+        result = await judge.judge_with_details(request.query, session_id=request.session_id)
         
         if result['final_result']:
             notification_content = f"检测到需要转人工服务：\n用户问题：{request.query}"
@@ -137,7 +165,7 @@ async def detect_risk(request: QueryRequest):
             elif result['matched_keywords']:
                 notification_content = f"检测到投诉风险：\n用户问题：{request.query}\n匹配关键词：{result['matched_keywords']}"
             
-            await send_wechat_group_notification(notification_content)
+            notification_dispatcher.enqueue(notification_content)
         
         return RiskResponse(
             is_risk=result['final_result'],
@@ -154,7 +182,13 @@ async def detect_risk(request: QueryRequest):
 )
 async def health_check():
     """健康检查端点"""
-    return {"status": "healthy", "service": "risk-detection-api"}
+    return {
+        "status": "healthy",
+        "service": "risk-detection-api",
+        "tolerance_store": judge.emotion_analyzer.tolerance_store.stats(),
+        "notifications": notification_dispatcher.stats(),
+        "micro_batch": judge.emotion_analyzer.batcher.stats() if judge.emotion_analyzer.batcher else None
+    }
 
 
 if __name__ == "__main__":
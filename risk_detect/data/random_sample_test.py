@@ -1,28 +1,26 @@
-import csv
-import random
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from csv_stream import iter_rows, reservoir_sample, write_rows
 
 def load_test_cases(file_path):
-    """加载CSV文件中的所有测试用例"""
-    test_cases = []
-    with open(file_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            test_cases.append(row)
-    return test_cases
+    """逐条读取CSV文件中的测试用例"""
+    return iter_rows(file_path, encoding='utf-8-sig')
 
 def random_sample(test_cases, sample_size=10):
-    """随机抽取指定数量的测试用例"""
-    if len(test_cases) <= sample_size:
-        return test_cases
-    return random.sample(test_cases, sample_size)
+    """蓄水池抽样：单次遍历随机抽取指定数量的测试用例
+
+    注意：与改造前的 random.sample 相比，相同随机种子抽到的行不同，样本的顺序也不同。
+    """
+    return reservoir_sample(test_cases, sample_size)
 
 def save_sample(sample_cases, output_file):
     """保存抽取的样本到CSV文件"""
-    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
-        fieldnames = ['用户请求', '预期情况']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(sample_cases)
+    fieldnames = ['用户请求', '预期情况']
+    write_rows(output_file, fieldnames, sample_cases, encoding='utf-8-sig')
 
 def main():
     input_file = 'data/test_sample.csv'
@@ -31,12 +29,8 @@ def main():
     
     print(f"正在从 {input_file} 中随机抽取 {sample_size} 条测试用例...")
     
-    # 加载所有测试用例
-    all_test_cases = load_test_cases(input_file)
-    print(f"总共加载了 {len(all_test_cases)} 条测试用例")
-    
-    # 随机抽取500条
-    sample_cases = random_sample(all_test_cases, sample_size)
+    # 流式读取并抽样，不把全部测试用例加载到内存
+    sample_cases = random_sample(load_test_cases(input_file), sample_size)
     
     # 保存到新文件
     save_sample(sample_cases, output_file)
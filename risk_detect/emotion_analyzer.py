@@ -1,38 +1,52 @@
 import requests
 import json
 from typing import Dict, Any
-from openai import OpenAI
+from llm_client import CLASSIFY_MAX_TOKENS, classify, get_async_client, parse_label
+from micro_batcher import create_micro_batcher
 from risk_detect.config import Config
+from risk_detect.session_store import ToleranceStore, InMemoryToleranceStore, DEFAULT_SESSION_ID
+
+EMOTION_LABELS = ["true", "false"]
+
 
 class EmotionAnalyzer:
-    def __init__(self):
+    def __init__(self, tolerance_store: ToleranceStore = None, max_retries: int = None):
         Config.validate()
         self.api_key = Config.QWEN_API_KEY
         self.api_url = Config.QWEN_API_URL
         self.model = Config.QWEN_MODEL
-        self.c_tolerance = 2
+        # 投诉容忍次数按会话存储，避免不同用户共用同一个计数
+        self.tolerance_store = tolerance_store or InMemoryToleranceStore()
         
-        # 初始化本地模型客户端
-        self.local_client = OpenAI(
-            api_key="EMPTY",
-            base_url=self.api_url
-        )
+        # 初始化本地模型客户端（共享异步连接池）；max_retries 为 SDK 内部重试次数，默认 LLM_MAX_RETRIES
+        self.local_client = get_async_client(self.api_url, max_retries=max_retries)
         self.local_model = self.model
+        # 开启微批调度时，并发的情感分析请求攒批后通过 completions 接口一次提交
+        self.batcher = create_micro_batcher(
+            self.local_client, self.local_model, temperature=0.1, max_tokens=CLASSIFY_MAX_TOKENS
+        )
     
-    def _call_local_model(self, prompt: str) -> Dict[str, Any]:
+    async def _call_local_model(self, prompt: str) -> Dict[str, Any]:
+        messages = [
+            {"role": "system", "content": Config.EMOTION_ANALYZER_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
         try:
-            response = self.local_client.chat.completions.create(
-                model=self.local_model,
-                messages=[
-                    {"role": "system", "content": Config.EMOTION_ANALYZER_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-            )
+            # 只需输出 true/false：限制 max_tokens 并解析标签，无法解析时按 false 处理
+            logprob = None
+            if self.batcher is not None:
+                raw = await self.batcher.submit(messages)
+                content = parse_label(raw, EMOTION_LABELS) or "false"
+            else:
+                result = await classify(
+                    self.local_client, self.local_model, messages, EMOTION_LABELS,
+                    default="false", temperature=0.1,
+                )
+                content, logprob, raw = result
             return {
                 "output": {
                     "choices": [
-                        {"message": {"content": response.choices[0].message.content}}
+                        {"message": {"content": content}, "raw_content": raw, "logprob": logprob}
                     ]
                 }
             }
@@ -76,9 +90,10 @@ class EmotionAnalyzer:
         except requests.exceptions.RequestException as e:
             raise Exception(f"API调用失败: {str(e)}")  
     
-    def analyze_emotion_with_details(self, query: str, context: list = None) -> Dict[str, Any]:
-        if self.c_tolerance == 0:
-            self.c_tolerance = 2
+    async def analyze_emotion_with_details(self, query: str, context: list = None,
+                                           session_id: str = None) -> Dict[str, Any]:
+        session_id = session_id or DEFAULT_SESSION_ID
+        if await self.tolerance_store.reset_if_exhausted(session_id):
             return {
                 'is_complaint': True,
                 'raw_response': 'true',
@@ -104,13 +119,13 @@ class EmotionAnalyzer:
         
         try:
             #在这里修改使用本地模型还是qwen api
-            result = self._call_local_model(prompt)
+            result = await self._call_local_model(prompt)
             
             if 'output' in result and 'choices' in result['output']:
                 content = result['output']['choices'][0]['message']['content'].strip().lower()
                 is_complaint = content == 'true'
                 if is_complaint:
-                    self.c_tolerance -= 1
+                    await self.tolerance_store.record_complaint(session_id)
                 
                 return {
                     'is_complaint': is_complaint,
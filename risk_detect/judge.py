@@ -1,13 +1,35 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 import os
-from risk_detect.keyword_extractor import KeywordExtractor
+import jieba
+from risk_detect.keyword_matcher import KeywordMatcher
 from risk_detect.emotion_analyzer import EmotionAnalyzer
+from risk_detect.session_store import ToleranceStore
+
+# 关键词类别
+CATEGORY_COMPLAINT = 'complaint'
+CATEGORY_PRICE = 'price'
+CATEGORY_MANUAL_SERVICE = 'manual_service'
 
 class CustomerServiceJudge:
-    def __init__(self, keyword_list):
-        self.keyword_extractor = KeywordExtractor(keyword_list)
-        self.emotion_analyzer = EmotionAnalyzer()
+    def __init__(self, keyword_list, full_evaluation: bool = False,
+                 tolerance_store: ToleranceStore = None, llm_max_retries: int = None):
+        """
+        Args:
+            keyword_list: 投诉相关关键词列表
+            full_evaluation: 是否总是调用情感分析。在线服务保持 False，未命中投诉关键词时
+                跳过 LLM 调用；离线准确率评测可设为 True 以记录每条用例的情感结果
+            tolerance_store: 会话级投诉容忍度存储，默认使用进程内存储
+            llm_max_retries: 情感分析客户端的 SDK 内部重试次数；批量评测由 AdaptiveLimiter 重试时设为 0
+        """
+        self.full_evaluation = full_evaluation
+        self.emotion_analyzer = EmotionAnalyzer(tolerance_store, max_retries=llm_max_retries)
         self.price_keywords, self.manual_service_keywords = self._load_keywords()
+        # 投诉、价格、人工服务三类关键词编译进同一个自动机，一次扫描得到全部类别
+        self.keyword_matcher = KeywordMatcher.from_keyword_lists({
+            CATEGORY_COMPLAINT: keyword_list,
+            CATEGORY_PRICE: self.price_keywords,
+            CATEGORY_MANUAL_SERVICE: self.manual_service_keywords,
+        })
     
     def _load_keywords(self):
         """从文件加载价格和人工服务关键词"""
@@ -25,28 +47,32 @@ class CustomerServiceJudge:
             print("警告：未找到keywords文件，使用默认关键词")
         return keywords_price, keywords_manual
     
+    @staticmethod
+    def _complaint_keywords(user_query: str, candidates: List[str]) -> List[str]:
+        """投诉关键词需与 jieba 分词结果完全一致（不按子串匹配），自动机命中候选词时才分词"""
+        if not candidates:
+            return []
+        tokens = set(jieba.lcut(user_query))
+        return [keyword for keyword in candidates if keyword in tokens]
+
     def _has_manual_service_request(self, user_query: str) -> bool:
         """检测用户是否主动要求转接人工服务"""
-        user_query_lower = user_query.lower()
-        for keyword in self.manual_service_keywords:
-            if keyword in user_query_lower:
-                return True
-        return False
+        return CATEGORY_MANUAL_SERVICE in self.keyword_matcher.match_by_category(user_query)
     
     def _has_price_related_query(self, user_query: str) -> bool:
         """检测用户是否询问价格或优惠相关内容"""
-        user_query_lower = user_query.lower()
-        for keyword in self.price_keywords:
-            if keyword in user_query_lower:
-                return True
-        return False
+        return CATEGORY_PRICE in self.keyword_matcher.match_by_category(user_query)
     
-    def judge_with_details(self, user_query: str, context: list = None) -> Dict[str, Any]:
+    async def judge_with_details(self, user_query: str, context: list = None,
+                                 session_id: str = None) -> Dict[str, Any]:
+        # 一次扫描得到人工服务、价格、投诉三类关键词的命中情况
+        matches = self.keyword_matcher.match_by_category(user_query)
+        
         # 首先检查用户是否要求转接人工服务
-        manual_service_requested = self._has_manual_service_request(user_query)
+        manual_service_requested = CATEGORY_MANUAL_SERVICE in matches
         
         # 检查用户是否询问价格或优惠相关内容
-        price_related_query = self._has_price_related_query(user_query)
+        price_related_query = CATEGORY_PRICE in matches
         
         if manual_service_requested or price_related_query:
             # 如果用户要求转接人工服务或询问价格，直接返回True
@@ -56,15 +82,22 @@ class CustomerServiceJudge:
                 'keyword_match': True,
                 'matched_keywords': [request_type],
                 'emotion_match': True,
+                'emotion_evaluated': False,
                 'manual_service_requested': manual_service_requested,
                 'price_related_query': price_related_query,
             }
         
-        matched_keywords = self.keyword_extractor.get_matched_keywords(user_query)
+        matched_keywords = self._complaint_keywords(user_query, matches.get(CATEGORY_COMPLAINT, []))
         keyword_match = len(matched_keywords) > 0
         
-        emotion_result = self.emotion_analyzer.analyze_emotion_with_details(user_query, context)
-        emotion_match = emotion_result['is_complaint']
+        # 最终结果要求关键词与情感同时命中，未命中关键词时情感分析无法改变结果，直接跳过 LLM 调用
+        emotion_evaluated = keyword_match or self.full_evaluation
+        emotion_match = False
+        if emotion_evaluated:
+            emotion_result = await self.emotion_analyzer.analyze_emotion_with_details(
+                user_query, context, session_id
+            )
+            emotion_match = emotion_result['is_complaint']
 
         """综合判断最终结果，只有当关键词匹配且情感分析结果为投诉时才为True"""
         final_result = keyword_match and emotion_match
@@ -79,15 +112,16 @@ class CustomerServiceJudge:
         #     # 否则按照原有逻辑
         #     final_result = keyword_match and emotion_match
         
-        # 如果最终结果为true，重置c_tolerance为2
+        # 如果最终结果为true，重置会话的投诉容忍次数
         # if final_result:
-        #     self.emotion_analyzer.c_tolerance = 2
+        #     await self.emotion_analyzer.tolerance_store.reset(session_id)
         
         return {
             'final_result': final_result,
             'keyword_match': keyword_match,
             'matched_keywords': matched_keywords,
             'emotion_match': emotion_match,
+            'emotion_evaluated': emotion_evaluated,
             'manual_service_requested': False,
             'price_related_query': False,
         }
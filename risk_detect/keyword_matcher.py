@@ -0,0 +1,91 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class KeywordMatcher:
+    """基于 Aho-Corasick 自动机的多模式关键词匹配器
+
+    所有类别的关键词编译进同一个自动机，对查询只扫描一遍即可找出全部类别的命中词。
+    匹配不区分大小写，返回关键词的原始写法。
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, str]]] = [[]]
+        self._built = True
+
+    def add(self, keyword: str, category: str):
+        """添加一个关键词，添加后需重新 build"""
+        keyword = keyword.strip()
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword.lower():
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        entry = (keyword, category)
+        if entry not in self._output[state]:
+            self._output[state].append(entry)
+        self._built = False
+
+    def add_all(self, keywords: List[str], category: str):
+        for keyword in keywords:
+            self.add(keyword, category)
+
+    def build(self):
+        """广度优先计算失配指针，并把失配链上的输出合并到各状态"""
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            queue.append(next_state)
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                for entry in self._output[self._fail[next_state]]:
+                    if entry not in self._output[next_state]:
+                        self._output[next_state].append(entry)
+        self._built = True
+
+    def find_all(self, text: str) -> List[Tuple[str, str]]:
+        """扫描一遍文本，按出现位置返回所有命中的 (关键词, 类别)"""
+        if not self._built:
+            self.build()
+        matches = []
+        state = 0
+        for ch in text.lower():
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if self._output[state]:
+                matches.extend(self._output[state])
+        return matches
+
+    def match_by_category(self, text: str) -> Dict[str, List[str]]:
+        """按类别分组返回命中的关键词（去重，保持出现顺序）"""
+        grouped: Dict[str, List[str]] = {}
+        for keyword, category in self.find_all(text):
+            keywords = grouped.setdefault(category, [])
+            if keyword not in keywords:
+                keywords.append(keyword)
+        return grouped
+
+    @classmethod
+    def from_keyword_lists(cls, keyword_lists: Dict[str, List[str]]) -> "KeywordMatcher":
+        """从 {类别: 关键词列表} 构建匹配器"""
+        matcher = cls()
+        for category, keywords in keyword_lists.items():
+            matcher.add_all(keywords, category)
+        matcher.build()
+        return matcher
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 发送函数签名：(content, group_name, client) -> 是否成功
+SendFunc = Callable[[str, Optional[str], httpx.AsyncClient], Awaitable[bool]]
+
+
+class NotificationDispatcher:
+    """微信群通知后台分发器
+
+    风险接口只负责把通知放入进程内队列，由后台任务使用共享连接池发送：
+    - 短时间内发往同一个群的多条通知合并为一条发送
+    - 发送失败按指数退避重试
+    - 队列已满时丢弃新通知，避免拖慢接口响应
+    """
+
+    def __init__(self, send_func: SendFunc, max_queue_size: int = 1000,
+                 batch_window: float = 0.5, max_batch_size: int = 20,
+                 max_retries: int = 3, backoff_base: float = 0.5, timeout: float = 10.0):
+        """
+        Args:
+            send_func: 实际发送通知的协程函数
+            max_queue_size: 队列容量
+            batch_window: 收到第一条通知后等待合并的时间（秒）
+            max_batch_size: 单次合并的最大通知数
+            max_retries: 失败后的最大重试次数
+            backoff_base: 退避基数（秒），第 n 次重试前等待 backoff_base * 2^(n-1)
+            timeout: 单次发送超时（秒）
+        """
+        self.send_func = send_func
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._counters = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failed": 0,
+        }
+
+    def start(self):
+        """启动后台任务（需在事件循环中调用，重复调用无副作用）"""
+        if self._worker is not None and not self._worker.done():
+            return
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """停止后台任务，先尽量发送完队列中的通知"""
+        if self._worker is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"通知队列未在 {drain_timeout}s 内发送完，剩余 {self._queue.qsize()} 条")
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, content: str, group_name: str = None) -> bool:
+        """放入通知队列，立即返回；队列已满时丢弃并返回 False"""
+        self.start()
+        try:
+            self._queue.put_nowait((group_name, content))
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            logger.error(f"❌ Notification queue full, dropped: {content}")
+            return False
+        self._counters["enqueued"] += 1
+        return True
+
+    async def _collect_batch(self) -> List[tuple]:
+        """阻塞等待第一条通知，再在 batch_window 内收集后续通知"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            try:
+                grouped: Dict[Optional[str], List[str]] = {}
+                for group_name, content in batch:
+                    grouped.setdefault(group_name, []).append(content)
+                for group_name, contents in grouped.items():
+                    await self._send_with_retry(group_name, self._merge(contents))
+                    self._counters["coalesced"] += len(contents) - 1
+            except Exception as e:
+                logger.error(f"❌ Error dispatching notifications: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _merge(contents: List[str]) -> str:
+        if len(contents) == 1:
+            return contents[0]
+        return f"（合并 {len(contents)} 条通知）\n" + "\n\n---\n\n".join(contents)
+
+    async def _send_with_retry(self, group_name: Optional[str], content: str):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._counters["retries"] += 1
+                await asyncio.sleep(self.backoff_base * 2 ** (attempt - 1))
+            if await self.send_func(content, group_name, self._client):
+                self._counters["sent"] += 1
+                return
+        self._counters["failed"] += 1
+
+    def stats(self) -> dict:
+        """队列深度与发送统计"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "running": self._worker is not None and not self._worker.done(),
+            **self._counters,
+        }
+
+
+def create_notification_dispatcher(send_func: SendFunc) -> NotificationDispatcher:
+    """根据环境变量创建通知分发器"""
+    return NotificationDispatcher(
+        send_func,
+        max_queue_size=int(os.getenv("NOTIFY_QUEUE_SIZE", "1000")),
+        batch_window=float(os.getenv("NOTIFY_BATCH_WINDOW", "0.5")),
+        max_batch_size=int(os.getenv("NOTIFY_MAX_BATCH_SIZE", "20")),
+        max_retries=int(os.getenv("NOTIFY_MAX_RETRIES", "3")),
+        backoff_base=float(os.getenv("NOTIFY_BACKOFF_BASE", "0.5")),
+    )
@@ -1,4 +1,13 @@
-import csv
+import asyncio
+import os
+import sys
+from collections import deque
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive_limiter import ADAPTIVE_CLIENT_MAX_RETRIES, AdaptiveLimiter, ordered_map
+from csv_stream import CsvRowWriter, iter_rows
 from judge import CustomerServiceJudge
 
 def load_keywords(file_path):
@@ -7,42 +16,43 @@ def load_keywords(file_path):
     return keywords
 
 def load_test_cases(file_path):
-    test_cases = []
-    with open(file_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            test_cases.append({
-                'query': row['用户请求'],
-                'expected': row['预期情况']
-            })
-    return test_cases
+    """逐条读取测试用例"""
+    for row in iter_rows(file_path, encoding='utf-8-sig'):
+        yield {
+            'query': row['用户请求'],
+            'expected': row['预期情况']
+        }
 
-def main():
-    print("=== 智能客服问答系统测试 ===\n")
-    
-    keyword_list = load_keywords('keywords.txt')
-    print(f"已加载 {len(keyword_list)} 个关键词")
-    
-    judge = CustomerServiceJudge(keyword_list)
-    
-    # 测试用例 - 从test_sample.csv文件读取
-    test_cases = load_test_cases('data/test_sample_10.csv')
-    
-    print(f"\n=== 测试用例（从test_sample.csv读取，共{len(test_cases)}条） ===\n")
-    
-    # 存储测试结果
-    results = []
-    
-    for i, case in enumerate(test_cases, 1):
+async def judge_test_cases(judge, test_cases, limiter, shared_session=True):
+    """
+    在 limiter 控制下判断测试用例，按输入顺序输出并产出结果行
+
+    shared_session 为 True 时与原评测一致，所有用例共用默认会话、投诉容忍计数跨用例累积，
+    结果依赖判断顺序，limiter 的并发数必须为 1；False 时每条用例使用独立会话，可以并发。
+    """
+    # ordered_map 按顺序读取用例、按顺序产出结果，用队列把结果与用例对应起来
+    submitted = deque()
+
+    def submit_cases():
+        for i, case in enumerate(test_cases, 1):
+            submitted.append((i, case))
+            yield i, case
+
+    async def judge_case(item):
+        i, case = item
+        # 只传递query，不传递context
+        session_id = None if shared_session else f"eval-{i}"
+        return await judge.judge_with_details(case['query'], session_id=session_id)
+
+    results = ordered_map(judge_case, submit_cases(), limiter, return_exceptions=True)
+    async for result in results:
+        i, case = submitted.popleft()
         print(f"测试用例 {i}:")
         print(f"用户请求: {case['query']}")
         print(f"预期情况: {case['expected']}")
         print("-" * 50)
         
-        try:
-            # 只传递query，不传递context
-            result = judge.judge_with_details(case['query'])
-            
+        if not isinstance(result, Exception):
             final_result = result['final_result']
             print(f"最终结果: {final_result}")
             print(f"关键词匹配: {result['keyword_match']}")
@@ -50,33 +60,59 @@ def main():
             print(f"情感匹配: {result['emotion_match']}")
             
             # 保存结果
-            results.append({
+            row = {
                 '用户请求': case['query'],
                 '预期情况': case['expected'],
                 '最终结果': final_result,
                 '情感匹配': result['emotion_match']
-            })
-            
-        except Exception as e:
-            print(f"处理失败: {str(e)}")
+            }
+        else:
+            print(f"处理失败: {str(result)}")
             # 保存失败结果
-            results.append({
+            row = {
                 '用户请求': case['query'],
                 '预期情况': case['expected'],
                 '最终结果': 'error'
-            })
+            }
         
         print()
+        yield row
+
+async def main():
+    print("=== 智能客服问答系统测试 ===\n")
+    
+    keyword_list = load_keywords('keywords.txt')
+    print(f"已加载 {len(keyword_list)} 个关键词")
     
-    # 将结果写入新的CSV文件
+    # 离线评测需要记录每条用例的情感结果，关闭情感分析短路
+    # 过载错误交给 AdaptiveLimiter 降低并发后重试，客户端不在内部重试
+    judge = CustomerServiceJudge(keyword_list, full_evaluation=True, llm_max_retries=ADAPTIVE_CLIENT_MAX_RETRIES)
+    
+    # 测试用例 - 从test_sample.csv文件读取
+    input_file = 'data/test_sample_10.csv'
     output_file = 'data/test_sample_results_10.csv'
-    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
-        fieldnames = ['用户请求', '预期情况', '最终结果', '情感匹配']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+    fieldnames = ['用户请求', '预期情况', '最终结果', '情感匹配']
+    
+    print(f"\n=== 测试用例（从{input_file}读取） ===\n")
+    
+    # 会话模式：shared（默认）与原评测一致，共用一个会话、逐条按顺序判断；
+    # per-case 每条用例独立会话、不累积投诉容忍计数，可并发，但结果与 shared 模式不可直接比较
+    shared_session = os.getenv("RISK_EVAL_SESSION", "shared") != "per-case"
+    if shared_session:
+        limiter = AdaptiveLimiter(1, adaptive=False, name="风险识别评测")
+    else:
+        # 并发数按情感分析接口的延迟与错误自适应调整
+        limiter = AdaptiveLimiter(int(os.getenv("RISK_EVAL_CONCURRENCY", "8")), name="风险识别评测")
+    print(f"会话模式: {'shared' if shared_session else 'per-case'}")
+    
+    # 边判断边写入结果文件
+    with CsvRowWriter(output_file, fieldnames, encoding='utf-8-sig') as writer:
+        async for row in judge_test_cases(judge, load_test_cases(input_file), limiter, shared_session):
+            writer.writerow(row)
+            writer.flush()
+    limiter.print_summary()
     
-    print(f"\n=== 测试完成，结果已保存至 {output_file} ===")
+    print(f"\n=== 测试完成（共{writer.count}条），结果已保存至 {output_file} ===")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+# 每个会话的投诉容忍次数：连续判定为投诉达到该次数后，下一次请求直接视为投诉
+DEFAULT_TOLERANCE = 2
+# 未携带 session_id 的请求共用的会话
+DEFAULT_SESSION_ID = "default"
+
+
+class ToleranceStore(ABC):
+    """会话级投诉容忍度存储接口
+
+    只有被扣减过的会话才会占用存储，未出现过的会话视为拥有完整的容忍次数。
+    """
+
+    @abstractmethod
+    async def reset_if_exhausted(self, session_id: str) -> bool:
+        """若会话容忍次数已耗尽，则原子地重置并返回 True，否则返回 False"""
+
+    @abstractmethod
+    async def record_complaint(self, session_id: str) -> int:
+        """原子地扣减一次容忍次数，返回剩余次数"""
+
+    @abstractmethod
+    async def reset(self, session_id: str):
+        """重置会话的容忍次数"""
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemoryToleranceStore(ToleranceStore):
+    """进程内存储，按最近访问顺序做 TTL 淘汰，并限制最大会话数"""
+
+    def __init__(self, tolerance: int = DEFAULT_TOLERANCE, ttl: float = 1800,
+                 max_sessions: int = 100000):
+        self.tolerance = tolerance
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # session_id -> (剩余次数, 过期时间)，按最近写入排序，队首最旧
+        self._sessions: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._evicted = 0
+
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, (_, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            self._evicted += 1
+
+    def _remaining(self, session_id: str, now: float) -> int:
+        entry = self._sessions.get(session_id)
+        if entry is None or entry[1] <= now:
+            return self.tolerance
+        return entry[0]
+
+    async def reset_if_exhausted(self, session_id: str) -> bool:
+        async with self._lock:
+            now = time.time()
+            if self._remaining(session_id, now) > 0:
+                return False
+            self._sessions.pop(session_id, None)
+            return True
+
+    async def record_complaint(self, session_id: str) -> int:
+        async with self._lock:
+            now = time.time()
+            remaining = max(self._remaining(session_id, now) - 1, 0)
+            self._sessions[session_id] = (remaining, now + self.ttl)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+            return remaining
+
+    async def reset(self, session_id: str):
+        async with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "evicted": self._evicted,
+        }
+
+
+class RedisToleranceStore(ToleranceStore):
+    """基于 Redis（或兼容 Redis 协议的本地服务）的存储，多进程共享，使用 Lua 脚本保证原子性
+
+    键中保存已扣减次数，并随每次扣减刷新 TTL。
+    """
+
+    _RESET_IF_EXHAUSTED = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used >= tonumber(ARGV[1]) then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+    _RECORD_COMPLAINT = """
+local used = redis.call('INCR', KEYS[1])
+if used > tonumber(ARGV[1]) then
+    used = tonumber(ARGV[1])
+    redis.call('SET', KEYS[1], used)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return tonumber(ARGV[1]) - used
+"""
+
+    def __init__(self, redis_client, tolerance: int = DEFAULT_TOLERANCE, ttl: float = 1800,
+                 key_prefix: str = "risk:tolerance:"):
+        """
+        Args:
+            redis_client: redis.asyncio.Redis 实例
+        """
+        self.redis = redis_client
+        self.tolerance = tolerance
+        self.ttl = int(ttl)
+        self.key_prefix = key_prefix
+        self._reset_script = redis_client.register_script(self._RESET_IF_EXHAUSTED)
+        self._record_script = redis_client.register_script(self._RECORD_COMPLAINT)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}"
+
+    async def reset_if_exhausted(self, session_id: str) -> bool:
+        result = await self._reset_script(keys=[self._key(session_id)], args=[self.tolerance])
+        return bool(result)
+
+    async def record_complaint(self, session_id: str) -> int:
+        result = await self._record_script(
+            keys=[self._key(session_id)], args=[self.tolerance, self.ttl]
+        )
+        return int(result)
+
+    async def reset(self, session_id: str):
+        await self.redis.delete(self._key(session_id))
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+def create_tolerance_store(backend: Optional[str] = None) -> ToleranceStore:
+    """根据环境变量创建容忍度存储
+
+    RISK_SESSION_STORE=memory（默认）或 redis；redis 时从 REDIS_URL 读取地址。
+    RISK_SESSION_TTL 为会话过期时间（秒），RISK_SESSION_MAX 为内存模式下的最大会话数。
+    """
+    backend = backend or os.getenv("RISK_SESSION_STORE", "memory")
+    ttl = float(os.getenv("RISK_SESSION_TTL", "1800"))
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise ImportError("RISK_SESSION_STORE=redis 需要安装 redis 包：pip install redis") from e
+        redis_client = redis_asyncio.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisToleranceStore(redis_client, ttl=ttl)
+    if backend != "memory":
+        raise ValueError(f"未知的 RISK_SESSION_STORE: {backend}")
+    return InMemoryToleranceStore(
+        ttl=ttl,
+        max_sessions=int(os.getenv("RISK_SESSION_MAX", "100000")),
+    )
@@ -1,26 +1,12 @@
-import csv
 import os
 import random
 
+from csv_stream import iter_rows, read_fieldnames, reservoir_sample, write_rows
 
-def read_rows(path):
-    with open(path, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-        return reader.fieldnames, rows
 
-
-def write_rows(path, fieldnames, rows):
-    with open(path, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-
-
-def sample_rows(rows, n):
-    if len(rows) <= n:
-        return rows
-    return random.sample(rows, n)
+def sample_rows(path, n):
+    """流式读取 path 并用蓄水池抽样抽取 n 行，内存占用只与 n 有关"""
+    return reservoir_sample(iter_rows(path), n)
 
 
 def main():
@@ -32,14 +18,14 @@ def main():
     random.seed(43)
     # random.seed(42)
 
-    neg_fields, neg_rows = read_rows(negative_path)
-    pos_fields, pos_rows = read_rows(positive_path)
+    neg_fields = read_fieldnames(negative_path)
+    pos_fields = read_fieldnames(positive_path)
 
     if neg_fields != pos_fields:
         raise ValueError("negative_data 和 positive_data 的列名不一致")
 
-    sampled_neg = sample_rows(neg_rows, 500)
-    sampled_pos = sample_rows(pos_rows, 500)
+    sampled_neg = sample_rows(negative_path, 500)
+    sampled_pos = sample_rows(positive_path, 500)
 
     combined = sampled_neg + sampled_pos
     random.shuffle(combined)
@@ -1,24 +1,28 @@
-import csv
+import argparse
+import json
 import math
 import os
+from functools import partial
 
 from dotenv import load_dotenv
 from openai import OpenAI
 from scipy import stats
-import jieba
+
+from csv_stream import iter_rows, read_fieldnames, write_rows
+from jieba_tokens import TokenCache, batch_tokenize, disable_parallel, enable_parallel
+from llm_client import classify_sync
+from sharding import map_chunks
 
 
 SEMANTIC_RELATED_LABEL = "1"
 SEMANTIC_UNRELATED_LABEL = "0"
 
-
-def jieba_exact_tokens(text: str) -> list[str]:
-    tokens = []
-    for token in jieba.cut(text, cut_all=False):  # 精确模式
-        token = (token or "").strip()
-        if token:
-            tokens.append(token)
-    return tokens
+# 分词缓存：按文本哈希 + 词典版本持久化，JIEBA_TOKEN_CACHE 为空时不使用持久化缓存
+TOKEN_CACHE_DB = os.getenv("JIEBA_TOKEN_CACHE", os.path.join("data", "jieba_token_cache.sqlite"))
+# jieba 并行分词进程数，<=1 表示不开启
+JIEBA_PARALLEL = int(os.getenv("JIEBA_PARALLEL", "0"))
+# 每批分词的行数
+TOKENIZE_CHUNK_SIZE = 5000
 
 load_dotenv()
 
@@ -29,8 +33,8 @@ MODEL_NAME = "/root/.cache/modelscope/hub/models/okwinds/Qwen3-30B-A3B-Instruct-
 # 本地模型不需要 API Key，使用占位符
 client = OpenAI(api_key="EMPTY", base_url=BASE_URL)
 
-# 系统提示词
-SYSTEM_PROMPT = (
+# 判断标准（单条与批量判定共用）
+SEMANTIC_CRITERIA_PROMPT = (
     "你是一个专业的语义相关性判定专家。\n\n"
 
     "# 任务说明\n"
@@ -47,11 +51,24 @@ SYSTEM_PROMPT = (
     "  - model_output中包含任何指代词（如'他''她''它''这个''那个'）\n"
     "  - 表达的主题或意图完全不同\n"
     "  - 关键实体或关系发生改变\n\n"
+)
 
+# 系统提示词
+SYSTEM_PROMPT = (
+    SEMANTIC_CRITERIA_PROMPT +
     "# 输出格式\n"
     "**严格要求**：只输出数字 0 或 1，不要包含任何其他内容。\n"
 )
 
+# 批量判定系统提示词：一次判断多组文本，返回 JSON 数组
+BATCH_SYSTEM_PROMPT = (
+    SEMANTIC_CRITERIA_PROMPT +
+    "# 输出格式\n"
+    "用户会给出多组待判断文本，请按组的顺序逐组判断。\n"
+    "**严格要求**：只输出一个 JSON 数组，元素依次为每组的判断结果（数字 0 或 1），"
+    "数组长度必须等于组数，不要包含任何其他内容。例如 3 组时输出：[1, 0, 1]\n"
+)
+
 # 用户提示词模板
 USER_PROMPT_TEMPLATE = """
 # 待判断文本
@@ -87,45 +104,144 @@ def semantic_judge(question: str, rewrite: str, model_output: str) -> str:
         model_output=model_output
     )
     
-    resp = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
+    # 只需输出 0/1：限制 max_tokens，取最先出现的标签，无法解析时默认返回0
+    result = classify_sync(
+        client,
+        MODEL_NAME,
+        [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
-        temperature=0,
+        [SEMANTIC_RELATED_LABEL, SEMANTIC_UNRELATED_LABEL],
+        default=SEMANTIC_UNRELATED_LABEL,
     )
-    
-    text = resp.choices[0].message.content.strip()
-    # 提取第一个数字字符
-    for char in text:
-        if char in ('0', '1'):
-            return char
-    return "0"  # 默认返回0
+    return result.label
 
 
 
-def main(): 
-    input_file = r"data\sample_records_only_pos_qwen3maxthinking.csv"
-    output_file = r"data\sample_records_only_pos_qwen3maxthinking.csv"
+# 批量判定中的单组模板
+BATCH_ITEM_TEMPLATE = """
+# 第 {index} 组
+## 原始问题（question）：
+{question}
 
-    with open(input_file, "r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-        fieldnames = list(reader.fieldnames or [])
+## 参考文本（rewrite）：
+{rewrite}
 
-    if "question" not in fieldnames or "rewrite" not in fieldnames or "model_output" not in fieldnames:
-        raise ValueError("CSV缺少question、rewrite或model_output列")
+## 待比较文本（model_output）：
+{model_output}
+"""
 
-    result_col = "semantic_related"
-    if result_col not in fieldnames:
-        fieldnames.append(result_col)
+# 默认每次请求打包的组数
+JUDGE_BATCH_SIZE = 10
+
+# LLM 判定请求统计
+judge_stats = {"batch_requests": 0, "batch_fallbacks": 0, "single_requests": 0}
+
+
+def parse_batch_labels(text: str, expected: int):
+    """
+    解析批量判定输出的 JSON 数组，校验长度与取值
+
+    Returns:
+        ["0"/"1", ...]，格式不合法时返回 None
+    """
+    start = text.find("[")
+    end = text.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        values = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(values, list) or len(values) != expected:
+        return None
+    labels = []
+    for value in values:
+        label = str(value).strip()
+        if label not in (SEMANTIC_RELATED_LABEL, SEMANTIC_UNRELATED_LABEL):
+            return None
+        labels.append(label)
+    return labels
+
+
+def semantic_judge_batch(triples: list) -> list:
+    """
+    一次请求判断多组 (question, rewrite, model_output) 的语义相关性
+
+    输出无法解析或数量不符时，自动退回逐条调用 semantic_judge。
+
+    Returns:
+        与 triples 等长的 "0"/"1" 列表
+    """
+    if len(triples) == 1:
+        judge_stats["single_requests"] += 1
+        return [semantic_judge(*triples[0])]
+
+    prompt = "".join(
+        BATCH_ITEM_TEMPLATE.format(index=i, question=question, rewrite=rewrite, model_output=model_output)
+        for i, (question, rewrite, model_output) in enumerate(triples, start=1)
+    ) + f"\n# 判断结果（共 {len(triples)} 组）\n"
+
+    judge_stats["batch_requests"] += 1
+    try:
+        resp = client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0,
+            # 每组标签加分隔符约 3 个 token，留出余量
+            max_tokens=len(triples) * 4 + 16,
+        )
+        labels = parse_batch_labels(resp.choices[0].message.content or "", len(triples))
+    except Exception as e:
+        print(f"批量判定调用失败，改为逐条判定: {e}")
+        labels = None
+
+    if labels is None:
+        judge_stats["batch_fallbacks"] += 1
+        judge_stats["single_requests"] += len(triples)
+        labels = [semantic_judge(*triple) for triple in triples]
+    return labels
+
+
+def semantic_judge_many(triples: list, batch_size: int = JUDGE_BATCH_SIZE) -> list:
+    """按 batch_size 分组调用 semantic_judge_batch，返回与 triples 等长的标签列表"""
+    labels = []
+    for i in range(0, len(triples), batch_size):
+        labels.extend(semantic_judge_batch(triples[i:i + batch_size]))
+    return labels
+
+
+# 当前进程使用的分词缓存，由 _init_token_cache 在每个（工作）进程中初始化
+_token_cache = None
+
+
+def _init_token_cache(db_path):
+    global _token_cache
+    _token_cache = TokenCache(db_path) if db_path else None
+
+
+def label_chunk(chunk, result_col):
+    """
+    对一个分片计算语义相关性标签
+
+    先对 rewrite/model_output 去重后统一分词（可命中持久化缓存），再逐行比较 token 序列。
+
+    Returns:
+        (带结果列的行, related_count, total_count)
+    """
+    texts = []
+    for row in chunk:
+        texts.append(row.get("rewrite", ""))
+        texts.append(row.get("model_output", ""))
+    tokens = batch_tokenize(texts, _token_cache)
 
     related_count = 0
     total_count = 0
-
-    for row in rows:
-        question = row.get("question", "")
+    for row in chunk:
         rewrite = row.get("rewrite", "")
         model_output = row.get("model_output", "")
         if not rewrite and not model_output:
@@ -133,34 +249,118 @@ def main():
             continue
 
         # 在调用模型前，先用jieba精确模式对 rewrite/model_output 分词并做完全匹配
-        rewrite_tokens = jieba_exact_tokens(rewrite)
-        model_tokens = jieba_exact_tokens(model_output)
-        if rewrite_tokens != model_tokens:
+        if tokens[rewrite] != tokens[model_output]:
             label = SEMANTIC_UNRELATED_LABEL
-            row[result_col] = label
-
-            total_count += 1
             # label 为 0 不计入 related_count
         else:
             label = SEMANTIC_RELATED_LABEL
-            row[result_col] = label
-            
-            total_count += 1
+        row[result_col] = label
+        total_count += 1
 
-        # label = semantic_judge(question, rewrite, model_output)
+        # label = semantic_judge(row.get("question", ""), rewrite, model_output)
         # row[result_col] = label
 
-
         if label == SEMANTIC_RELATED_LABEL:
             related_count += 1
+    return chunk, related_count, total_count
 
-    with open(output_file, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
 
+def llm_label_chunk(chunk, result_col, batch_size=JUDGE_BATCH_SIZE):
+    """
+    用 LLM 批量判定一个分片的语义相关性
+
+    Returns:
+        (带结果列的行, related_count, total_count)
+    """
+    judged_rows = []
+    triples = []
+    for row in chunk:
+        rewrite = row.get("rewrite", "")
+        model_output = row.get("model_output", "")
+        if not rewrite and not model_output:
+            row[result_col] = ""
+            continue
+        judged_rows.append(row)
+        triples.append((row.get("question", ""), rewrite, model_output))
+
+    labels = semantic_judge_many(triples, batch_size)
+    for row, label in zip(judged_rows, labels):
+        row[result_col] = label
+    related_count = sum(1 for label in labels if label == SEMANTIC_RELATED_LABEL)
+    return chunk, related_count, len(labels)
+
+
+def label_rows(rows, result_col, counts, workers=1, cache_db=TOKEN_CACHE_DB,
+               mode="jieba", judge_batch_size=JUDGE_BATCH_SIZE):
+    """
+    分片计算标签并按输入顺序产出带结果列的行
+
+    mode 为 jieba 时比较分词结果，workers>1 时各分片在进程池中并行处理，结果按分片顺序合并；
+    mode 为 llm 时在当前进程内按 judge_batch_size 组一请求调用模型判定。
+    counts 为 {"related": 0, "total": 0}，在迭代过程中累加。
+    """
+    if mode == "llm":
+        labeled_chunks = map_chunks(
+            partial(llm_label_chunk, result_col=result_col, batch_size=judge_batch_size),
+            rows, TOKENIZE_CHUNK_SIZE,
+        )
+    else:
+        labeled_chunks = map_chunks(
+            partial(label_chunk, result_col=result_col), rows, TOKENIZE_CHUNK_SIZE, workers,
+            initializer=_init_token_cache, initargs=(cache_db,),
+        )
+    for chunk, related_count, total_count in labeled_chunks:
+        counts["related"] += related_count
+        counts["total"] += total_count
+        yield from chunk
+
+
+def main(): 
+    parser = argparse.ArgumentParser(description="基于 jieba 分词的语义准确率评估")
+    parser.add_argument("--input", default=r"data\sample_records_only_pos_qwen3maxthinking.csv")
+    parser.add_argument("--output", default=r"data\sample_records_only_pos_qwen3maxthinking.csv")
+    parser.add_argument("--workers", type=int, default=1, help="分片并行处理的进程数（jieba 模式）")
+    parser.add_argument("--mode", choices=["jieba", "llm"], default="jieba", help="jieba 分词比对或 LLM 判定")
+    parser.add_argument("--judge-batch-size", type=int, default=JUDGE_BATCH_SIZE, help="LLM 判定时每次请求打包的组数")
+    args = parser.parse_args()
+    input_file = args.input
+    output_file = args.output
+
+    fieldnames = read_fieldnames(input_file)
+
+    if "question" not in fieldnames or "rewrite" not in fieldnames or "model_output" not in fieldnames:
+        raise ValueError("CSV缺少question、rewrite或model_output列")
+
+    result_col = "semantic_related"
+    if result_col not in fieldnames:
+        fieldnames.append(result_col)
+
+    # 多进程分片时不再开启 jieba 自身的并行模式
+    if args.mode == "jieba" and args.workers <= 1:
+        enable_parallel(JIEBA_PARALLEL)
+
+    # 边读边写；输入输出可能是同一个文件，先写临时文件再替换
+    counts = {"related": 0, "total": 0}
+    tmp_file = output_file + ".tmp"
+    try:
+        labeled = label_rows(
+            iter_rows(input_file), result_col, counts, args.workers,
+            mode=args.mode, judge_batch_size=args.judge_batch_size,
+        )
+        write_rows(tmp_file, fieldnames, labeled)
+    finally:
+        disable_parallel()
+        if _token_cache is not None:
+            print(f"分词缓存命中: {_token_cache.hits}，未命中: {_token_cache.misses}")
+            _token_cache.close()
+    os.replace(tmp_file, output_file)
+
+    related_count, total_count = counts["related"], counts["total"]
     ratio = (related_count / total_count) if total_count else 0.0
-    print(f"准确率(jieba): {ratio:.4f} ({related_count}/{total_count})")
+    print(f"准确率({args.mode}): {ratio:.4f} ({related_count}/{total_count})")
+    if args.mode == "llm":
+        print(f"LLM 判定请求: 批量 {judge_stats['batch_requests']} 次（回退 {judge_stats['batch_fallbacks']} 次），"
+              f"逐条 {judge_stats['single_requests']} 次")
 
 
 if __name__ == "__main__":
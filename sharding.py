@@ -0,0 +1,55 @@
+"""
+多进程分片处理
+把行流切成块后分发到进程池处理，结果按输入顺序产出，保证合并结果与单进程一致。
+
+map_chunks 在主进程中解析并 pickle 整块数据，只适合每行计算量远大于解析与序列化开销的任务（如分词）；
+轻量的逐行计算用 map_csv_ranges：主进程只切分字节区间，各工作进程自行读取并解析自己的区间。
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from csv_stream import csv_byte_ranges, iter_chunks
+
+
+def map_chunks(func: Callable[[list], object], rows: Iterable, chunk_size: int,
+               workers: int = 1, initializer: Callable = None, initargs: tuple = ()) -> Iterator:
+    """
+    按块对 rows 执行 func，按块的输入顺序产出结果
+
+    Args:
+        func: 处理一个块的函数，workers>1 时必须可被 pickle（模块级函数或其 functools.partial）
+        chunk_size: 每块行数
+        workers: 进程数，<=1 时在当前进程内顺序执行
+        initializer/initargs: 每个工作进程启动时执行一次（单进程时在当前进程执行）
+    """
+    chunks = iter_chunks(rows, chunk_size)
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield func(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        # 限制在途块数，避免一次性把整个文件读入内存
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(func, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def map_csv_ranges(func: Callable[[str, int, int], object], path: str, rows_per_range: int,
+                   workers: int) -> Iterator:
+    """
+    把 CSV 按记录边界切成字节区间，在进程池中执行 func(path, 起始偏移, 结束偏移)，按区间顺序产出结果
+
+    进程间只传递文件路径与偏移，解析在各工作进程内完成。func 必须可被 pickle。
+    """
+    ranges = csv_byte_ranges(path, rows_per_range)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, [path] * len(ranges), [start for start, _ in ranges], [end for _, end in ranges])
@@ -0,0 +1,55 @@
+"""
+进程内请求合并（single-flight）
+相同 key 的请求同时在途时只执行一次：第一个请求（leader）发起调用，之后到达的请求（follower）
+等待同一个结果。调用在独立的 task 中执行，任何一个调用方取消（如客户端断开）都不会中断其它调用方。
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """按 key 合并并发的相同调用"""
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        执行 func 并返回结果；相同 key 已有调用在途时直接等待该调用的结果
+
+        调用失败时，leader 与所有 follower 收到同一个异常。
+
+        Returns:
+            (结果, 是否复用了其它请求的调用)
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 读取异常，避免所有调用方都已取消时出现 "exception was never retrieved" 警告
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        total = self.leaders + self.coalesced
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "coalesce_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,81 @@
+"""
+Prompt token 计数
+配置 PROMPT_TOKENIZER（HuggingFace tokenizer 名称或本地路径，需安装 transformers）时使用真实分词器；
+未配置或加载失败时使用快速近似计数：中文等 CJK 字符与数字按 1 个 token，英文单词按每 4 个字母 1 个 token，
+其余符号按 1 个 token，连续空白按 1 个 token。近似值通常略高于 Qwen 分词结果，用作预算上限是安全的。
+"""
+
+import math
+import os
+import re
+
+
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "")
+
+_TOKEN_PATTERN = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]"  # CJK 字符
+    r"|[A-Za-z]+"
+    r"|\d"
+    r"|\s+"
+    r"|."
+)
+
+# None 表示尚未加载，False 表示不可用
+_tokenizer = None
+
+
+def _load_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = False
+        if PROMPT_TOKENIZER:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(PROMPT_TOKENIZER)
+            except Exception as e:
+                print(f"加载分词器 {PROMPT_TOKENIZER} 失败，使用近似计数: {e}")
+    return _tokenizer
+
+
+def tokenizer_name() -> str:
+    """当前使用的计数方式，用于报告"""
+    return PROMPT_TOKENIZER if _load_tokenizer() else "approx"
+
+
+def _approx_piece_tokens(piece: str) -> int:
+    if piece[0].isascii() and piece[0].isalpha():
+        return math.ceil(len(piece) / 4)
+    return 1
+
+
+def approx_count_tokens(text: str) -> int:
+    return sum(_approx_piece_tokens(match.group()) for match in _TOKEN_PATTERN.finditer(text))
+
+
+def count_tokens(text: str) -> int:
+    """统计文本的 token 数"""
+    if not text:
+        return 0
+    tokenizer = _load_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return approx_count_tokens(text)
+
+
+def truncate_tokens(text: str, max_tokens: int, suffix: str = "…") -> str:
+    """截断到不超过 max_tokens 个 token（保留开头），发生截断时追加 suffix"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    tokenizer = _load_tokenizer()
+    if tokenizer:
+        ids = tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+        return tokenizer.decode(ids) + suffix
+    count = 0
+    end = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        tokens = _approx_piece_tokens(match.group())
+        if count + tokens > max_tokens:
+            break
+        count += tokens
+        end = match.end()
+    return text[:end] + suffix